@@ -0,0 +1,122 @@
+"""
+Replays a synthetic MBO stream dominated by cancels and modifies on a handful of
+deep price levels through the book engines in `phitech.helpers.sierra`.
+
+    python benchmarks/book_cancel_modify.py [n_events] [queue_depth]
+
+`ListBook` keeps the old list-backed level queues (linear `list.remove`) as the
+reference to compare against.
+"""
+
+import random
+import sys
+import time
+from pathlib import Path
+
+import databento as db
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from phitech.helpers.sierra import ArrayBook, Book, LevelOrders
+
+TICK = 250_000_000
+BASE_PX = 4_500_000_000_000
+
+
+class ListBook(Book):
+    def _get_or_insert_level(self, price: int, side: str) -> LevelOrders:
+        levels = self._side_levels(side)
+        if price in levels:
+            return levels[price]
+        level = LevelOrders(price=price, orders=[])
+        levels[price] = level
+        return level
+
+
+def make_stream(n_events, queue_depth, n_levels=5, seed=42, tick=TICK, base_px=BASE_PX):
+    rnd = random.Random(seed)
+    events = []
+    resting = {}
+    order_id = 1
+    ts = 0
+
+    def price_for(side):
+        offset = rnd.randrange(n_levels)
+        return base_px + (offset + 1) * tick if side == "A" else base_px - offset * tick
+
+    # build deep queues first
+    for _ in range(queue_depth * n_levels * 2):
+        side = rnd.choice("AB")
+        px, sz = price_for(side), rnd.randint(1, 20)
+        events.append((ts, "A", side, order_id, px, sz))
+        resting[order_id] = (side, px, sz)
+        order_id += 1
+        ts += 1
+
+    ids = list(resting)
+    for _ in range(n_events):
+        ts += 1
+        idx = rnd.randrange(len(ids))
+        oid = ids[idx]
+        side, px, sz = resting[oid]
+        r = rnd.random()
+        if r < 0.5:
+            # full cancel and replace with a new order at the back of a queue
+            events.append((ts, "C", side, oid, px, sz))
+            del resting[oid]
+            px, sz = price_for(side), rnd.randint(1, 20)
+            events.append((ts, "A", side, order_id, px, sz))
+            resting[order_id] = (side, px, sz)
+            ids[idx] = order_id
+            order_id += 1
+        elif r < 0.75:
+            # size increase, loses priority
+            sz += rnd.randint(1, 5)
+            events.append((ts, "M", side, oid, px, sz))
+            resting[oid] = (side, px, sz)
+        else:
+            # price change
+            px = price_for(side)
+            events.append((ts, "M", side, oid, px, sz))
+            resting[oid] = (side, px, sz)
+    return events
+
+
+def replay(book, events, snapshot_every=0, level_count=100):
+    flags = db.RecordFlags(0)
+    start = time.perf_counter()
+    for i, (ts, action, side, order_id, price, size) in enumerate(events):
+        book.apply(ts, action, side, order_id, price, size, flags)
+        if snapshot_every and i % snapshot_every == 0:
+            book.get_snapshot(level_count)
+    return time.perf_counter() - start
+
+
+def run(n_events=50_000, queue_depth=1_000):
+    events = make_stream(n_events, queue_depth)
+    print(f"events -> {len(events)}, queue depth -> ~{queue_depth} orders/level")
+    snapshots = {}
+    results = {}
+    for name, book in [
+        ("list queue", ListBook()),
+        ("order queue", Book()),
+        ("array book", ArrayBook(tick_size=TICK)),
+    ]:
+        results[name] = replay(book, events)
+        snapshots[name] = [str(b) for b in book.get_snapshot(10)]
+        print(f"{name:>12} -> {results[name]:8.3f}s")
+    assert len({tuple(s) for s in snapshots.values()}) == 1, "books diverged"
+    print(f"speedup -> {results['list queue'] / results['order queue']:.1f}x")
+
+    # wide book with a 100 level snapshot every 10 events
+    events = make_stream(n_events, queue_depth=20, n_levels=200)
+    print(f"events -> {len(events)}, 200 levels, snapshot(100) every 10 events")
+    for name, book in [
+        ("order queue", Book()),
+        ("array book", ArrayBook(tick_size=TICK)),
+    ]:
+        print(f"{name:>12} -> {replay(book, events, snapshot_every=10):8.3f}s")
+
+
+if __name__ == "__main__":
+    run(*[int(a) for a in sys.argv[1:]])
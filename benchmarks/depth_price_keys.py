@@ -0,0 +1,99 @@
+"""
+Runs the depth generators of `phitech.helpers.sierra` on a DBN MBO file and
+compares their throughput and output:
+
+    bento-to-depth       the C++ binary (on PATH) through `bento_to_depth`, in
+                         snapshot and incremental mode
+    python incremental   `bento_to_depth_incremental`
+    python slow          `bento_to_depth_slow`, the pandas merge
+
+All of them diff on int64 fixed point prices. Pass a bento-to-depth binary built
+from before that change as `baseline` to compare against the float keyed one.
+
+    python benchmarks/depth_price_keys.py <file.dbn.zst> [n_states] [baseline]
+
+The snapshot paths write the empty levels of a side with fewer than 100 levels
+at the UNDEF_PRICE sentinel (and the slow path's merge multiplies those rows),
+records at that price are left out of the comparison. The slow path takes
+minutes per 1k states, keep n_states small for it.
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from databento_dbn import FIXED_PRICE_SCALE, UNDEF_PRICE
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from phitech.helpers.sierra import (
+    DepthFile,
+    bento_to_depth,
+    bento_to_depth_incremental,
+    bento_to_depth_slow,
+)
+
+SNAPSHOT_SIZE = 100
+UNDEF_DEPTH_PRICE = np.float32(UNDEF_PRICE / FIXED_PRICE_SCALE)
+
+
+def run_baseline(binary):
+    def run(input_path, target_path, n_states):
+        subprocess.run(
+            [binary, input_path, target_path, str(SNAPSHOT_SIZE), str(n_states)],
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+
+    return run
+
+
+def record_set(path):
+    # implementations order the commands of one timestamp differently
+    records = DepthFile(path).records
+    records = records[records["price"] != UNDEF_DEPTH_PRICE]
+    return set(records.tolist())
+
+
+def run(input_path, n_states=20, baseline=None):
+    n_states = int(n_states)
+    # the incremental paths count the initial state, the snapshot ones do not
+    generators = {
+        "bento-to-depth snapshot": lambda i, t, n: bento_to_depth(
+            i, t, SNAPSHOT_SIZE, n, incremental=False
+        ),
+        "bento-to-depth incremental": lambda i, t, n: bento_to_depth(
+            i, t, SNAPSHOT_SIZE, n + 1
+        ),
+        "python incremental": lambda i, t, n: bento_to_depth_incremental(
+            i, t, SNAPSHOT_SIZE, n + 1
+        ),
+        "python slow": bento_to_depth_slow,
+    }
+    if baseline is not None:
+        generators["baseline"] = run_baseline(baseline)
+
+    reference = None
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {}
+        for name, generate in generators.items():
+            target_path = os.path.join(tmp, f"{name.replace(' ', '-')}.depth")
+            start = time.perf_counter()
+            generate(input_path, target_path, n_states)
+            results[name] = time.perf_counter() - start
+            records = record_set(target_path)
+            if reference is None:
+                reference = records
+            results[name] = (results[name], len(records), len(records ^ reference))
+
+    print(f"{input_path} -> {n_states} states of {SNAPSHOT_SIZE} levels per side")
+    for name, (elapsed, n_records, n_diff) in results.items():
+        print(f"{name:>26} -> {elapsed:8.3f}s, {n_records} records, {n_diff} differ")
+
+
+if __name__ == "__main__":
+    run(*sys.argv[1:])
@@ -0,0 +1,172 @@
+// Python bindings for the MBO book in book.hpp, exposed as the `bento_book`
+// module with the same API as phitech.helpers.sierra.Market.
+#include <pybind11/pybind11.h>
+#include <pybind11/stl.h>
+
+#include <cstring>
+#include <sstream>
+
+#include "book.hpp"
+
+namespace py = pybind11;
+using namespace phitech;
+
+namespace {
+
+py::object LevelToPy(const PriceLevel& level) {
+    if (!level) {
+        return py::none();
+    }
+    return py::cast(level);
+}
+
+py::tuple BboToPy(const std::pair<PriceLevel, PriceLevel>& bbo) {
+    return py::make_tuple(LevelToPy(bbo.first), LevelToPy(bbo.second));
+}
+
+// databento_dbn records expose their raw DBN bytes through bytes(record)
+MboMsg MboFromPy(const py::handle& obj) {
+    auto raw = py::reinterpret_steal<py::object>(PyObject_Bytes(obj.ptr()));
+    if (!raw) {
+        throw py::error_already_set();
+    }
+    char* data;
+    Py_ssize_t size;
+    PyBytes_AsStringAndSize(raw.ptr(), &data, &size);
+    MboMsg mbo;
+    if (static_cast<std::size_t>(size) != sizeof(mbo)) {
+        throw std::invalid_argument{"Expected an MBO record of " + std::to_string(sizeof(mbo)) +
+                                    " bytes, got " + std::to_string(size)};
+    }
+    std::memcpy(&mbo, data, sizeof(mbo));
+    if (mbo.hd.rtype != RType::Mbo) {
+        throw std::invalid_argument{"Expected an MBO record"};
+    }
+    return mbo;
+}
+
+// Applies every MBO record in `buf`: either a raw DBN stream (uncompressed,
+// metadata included) or a contiguous record array such as
+// DBNStore.to_ndarray(). Returns the number of MBO records applied.
+std::size_t ApplyMany(Market& market, const py::buffer& buf) {
+    const py::buffer_info info = buf.request();
+    if (info.ndim > 1 || (info.ndim == 1 && info.strides[0] != info.itemsize)) {
+        throw std::invalid_argument{"Expected a contiguous buffer of DBN records"};
+    }
+    const auto* begin = static_cast<const char*>(info.ptr);
+    const std::size_t size = info.size * info.itemsize;
+    std::size_t offset = 0;
+    if (size >= 8 && std::memcmp(begin, "DBN", 3) == 0) {
+        uint32_t metadata_len;
+        std::memcpy(&metadata_len, begin + 4, sizeof(metadata_len));
+        offset = 8 + metadata_len;
+    }
+    std::size_t count = 0;
+    py::gil_scoped_release release;
+    while (offset + sizeof(RecordHeader) <= size) {
+        RecordHeader hd;
+        std::memcpy(&hd, begin + offset, sizeof(hd));
+        const std::size_t record_len = hd.length * RecordHeader::kLengthMultiplier;
+        if (record_len == 0 || offset + record_len > size) {
+            throw std::invalid_argument{"Truncated DBN record at offset " + std::to_string(offset)};
+        }
+        if (hd.rtype == RType::Mbo) {
+            MboMsg mbo;
+            std::memcpy(&mbo, begin + offset, sizeof(mbo));
+            market.Apply(mbo);
+            ++count;
+        }
+        offset += record_len;
+    }
+    return count;
+}
+
+}  // namespace
+
+PYBIND11_MODULE(bento_book, m) {
+    m.doc() = "Native MBO order book, same API as phitech.helpers.sierra.Market";
+
+    py::class_<PriceLevel>(m, "PriceLevel")
+        .def_readonly("price", &PriceLevel::price)
+        .def_readonly("size", &PriceLevel::size)
+        .def_readonly("count", &PriceLevel::count)
+        .def("__eq__",
+             [](const PriceLevel& lhs, const PriceLevel& rhs) {
+                 return lhs.price == rhs.price && lhs.size == rhs.size && lhs.count == rhs.count;
+             })
+        .def("__str__",
+             [](const PriceLevel& level) {
+                 std::ostringstream stream;
+                 stream << level;
+                 return stream.str();
+             })
+        .def("__repr__", [](const PriceLevel& level) {
+            return "PriceLevel(price=" + std::to_string(level.price) +
+                   ", size=" + std::to_string(level.size) +
+                   ", count=" + std::to_string(level.count) + ")";
+        });
+
+    py::class_<BidAskPair>(m, "BidAskPair")
+        .def_readonly("bid_px", &BidAskPair::bid_px)
+        .def_readonly("ask_px", &BidAskPair::ask_px)
+        .def_readonly("bid_sz", &BidAskPair::bid_sz)
+        .def_readonly("ask_sz", &BidAskPair::ask_sz)
+        .def_readonly("bid_ct", &BidAskPair::bid_ct)
+        .def_readonly("ask_ct", &BidAskPair::ask_ct);
+
+    py::class_<Book>(m, "Book")
+        .def(py::init<>())
+        .def("bbo", [](const Book& book) { return BboToPy(book.Bbo()); })
+        .def(
+            "get_bid_level",
+            [](const Book& book, std::size_t idx) { return LevelToPy(book.GetBidLevel(idx)); },
+            py::arg("idx") = 0)
+        .def(
+            "get_ask_level",
+            [](const Book& book, std::size_t idx) { return LevelToPy(book.GetAskLevel(idx)); },
+            py::arg("idx") = 0)
+        .def("get_bid_level_by_px",
+             [](const Book& book, int64_t px) -> py::object {
+                 try {
+                     return LevelToPy(book.GetBidLevelByPx(px));
+                 } catch (const std::invalid_argument&) {
+                     return py::none();
+                 }
+             })
+        .def("get_ask_level_by_px",
+             [](const Book& book, int64_t px) -> py::object {
+                 try {
+                     return LevelToPy(book.GetAskLevelByPx(px));
+                 } catch (const std::invalid_argument&) {
+                     return py::none();
+                 }
+             })
+        .def("get_snapshot", &Book::GetSnapshot, py::arg("level_count") = 1)
+        .def("apply", [](Book& book, const py::handle& mbo) { book.Apply(MboFromPy(mbo)); });
+
+    py::class_<Market>(m, "Market")
+        .def(py::init<>())
+        .def("get_book", &Market::GetBook, py::return_value_policy::reference_internal,
+             py::arg("instrument_id"), py::arg("publisher_id"))
+        .def(
+            "bbo",
+            [](Market& market, uint32_t instrument_id, uint16_t publisher_id) {
+                return BboToPy(market.Bbo(instrument_id, publisher_id));
+            },
+            py::arg("instrument_id"), py::arg("publisher_id"))
+        .def(
+            "aggregated_bbo",
+            [](Market& market, uint32_t instrument_id) {
+                return BboToPy(market.AggregatedBbo(instrument_id));
+            },
+            py::arg("instrument_id"))
+        .def(
+            "get_snapshot",
+            [](Market& market, uint32_t instrument_id, uint16_t publisher_id,
+               std::size_t level_count) {
+                return market.GetBook(instrument_id, publisher_id).GetSnapshot(level_count);
+            },
+            py::arg("instrument_id"), py::arg("publisher_id"), py::arg("level_count") = 1)
+        .def("apply", [](Market& market, const py::handle& mbo) { market.Apply(MboFromPy(mbo)); })
+        .def("apply_many", &ApplyMany, py::arg("buffer"));
+}
@@ -0,0 +1,552 @@
+#pragma once
+
+#include <algorithm>
+#include <cstdint>
+#include <cstring>
+#include <databento/constants.hpp>    // kUndefPrice
+#include <databento/datetime.hpp>     // UnixNanos
+#include <databento/enums.hpp>        // Action, Side
+#include <databento/fixed_price.hpp>  // PxToString
+#include <databento/flag_set.hpp>
+#include <databento/record.hpp>  // BidAskPair, MboMsg, Record
+#include <deque>
+#include <fstream>
+#include <iostream>
+#include <iterator>
+#include <map>
+#include <set>
+#include <stdexcept>
+#include <string>
+#include <unordered_map>
+#include <utility>
+#include <vector>
+
+namespace phitech {
+
+using namespace databento;
+
+struct Order {
+    uint64_t id;
+    UnixNanos ts_event;
+    int64_t price;
+    uint32_t size;
+    Side side;
+    bool is_tob;
+};
+
+struct PriceLevel {
+    int64_t price{kUndefPrice};
+    uint32_t size{0};
+    uint32_t count{0};
+
+    bool IsEmpty() const { return price == kUndefPrice; }
+    operator bool() const { return !IsEmpty(); }
+};
+
+inline std::ostream& operator<<(std::ostream& stream, const PriceLevel& level) {
+    stream << level.size << " @ " << PxToString(level.price) << " | " << level.count << " order(s)";
+    return stream;
+}
+
+class Book {
+   public:
+    using Touched = std::set<std::pair<Side, int64_t>>;
+
+    std::pair<PriceLevel, PriceLevel> Bbo() const { return {GetBidLevel(), GetAskLevel()}; }
+
+    std::size_t LevelCount(Side side) const {
+        return side == Side::Bid ? bids_.size() : offers_.size();
+    }
+
+    PriceLevel GetBidLevel(std::size_t idx = 0) const {
+        if (bids_.size() > idx) {
+            // Reverse iterator to get highest bid prices first
+            auto level_it = bids_.rbegin();
+            std::advance(level_it, idx);
+            return GetPriceLevel(level_it->first, level_it->second);
+        }
+        return PriceLevel{};
+    }
+
+    PriceLevel GetAskLevel(std::size_t idx = 0) const {
+        if (offers_.size() > idx) {
+            auto level_it = offers_.begin();
+            std::advance(level_it, idx);
+            return GetPriceLevel(level_it->first, level_it->second);
+        }
+        return PriceLevel{};
+    }
+
+    PriceLevel GetBidLevelByPx(int64_t px) const {
+        auto level_it = bids_.find(px);
+        if (level_it == bids_.end()) {
+            throw std::invalid_argument{"No bid level at " + PxToString(px)};
+        }
+        return GetPriceLevel(px, level_it->second);
+    }
+
+    PriceLevel GetAskLevelByPx(int64_t px) const {
+        auto level_it = offers_.find(px);
+        if (level_it == offers_.end()) {
+            throw std::invalid_argument{"No ask level at " + PxToString(px)};
+        }
+        return GetPriceLevel(px, level_it->second);
+    }
+
+    // Level at `px`, empty if there is none (Get*LevelByPx throw instead)
+    PriceLevel FindLevel(Side side, int64_t px) const {
+        const SideLevels& levels = side == Side::Bid ? bids_ : offers_;
+        auto level_it = levels.find(px);
+        if (level_it == levels.end()) {
+            return PriceLevel{};
+        }
+        return GetPriceLevel(px, level_it->second);
+    }
+
+    // With tracking on, every (side, price) level changed is recorded until
+    // the next TakeTouched()
+    void TrackTouched(bool track) { track_touched_ = track; }
+
+    Touched TakeTouched() {
+        Touched res;
+        res.swap(touched_);
+        return res;
+    }
+
+    std::vector<BidAskPair> GetSnapshot(std::size_t level_count = 1) const {
+        std::vector<BidAskPair> res;
+        for (size_t i = 0; i < level_count; ++i) {
+            BidAskPair ba_pair{kUndefPrice, kUndefPrice, 0, 0, 0, 0};
+            auto bid = GetBidLevel(i);
+            if (bid) {
+                ba_pair.bid_px = bid.price;
+                ba_pair.bid_sz = bid.size;
+                ba_pair.bid_ct = bid.count;
+            }
+            auto ask = GetAskLevel(i);
+            if (ask) {
+                ba_pair.ask_px = ask.price;
+                ba_pair.ask_sz = ask.size;
+                ba_pair.ask_ct = ask.count;
+            }
+            res.emplace_back(ba_pair);
+        }
+        return res;
+    }
+
+    void Apply(const MboMsg& mbo_msg) {
+        switch (mbo_msg.action) {
+            case Action::Trade:
+            case Action::Fill: {
+                break;
+            }
+            case Action::Clear: {
+                Clear();
+                break;
+            }
+            case Action::Add: {
+                Add(mbo_msg.hd.ts_event, mbo_msg.side, mbo_msg.order_id, mbo_msg.price,
+                    mbo_msg.size, mbo_msg.flags.IsTob());
+                break;
+            }
+            case Action::Cancel: {
+                Cancel(mbo_msg.side, mbo_msg.order_id, mbo_msg.price, mbo_msg.size);
+                break;
+            }
+            case Action::Modify: {
+                Modify(mbo_msg.hd.ts_event, mbo_msg.side, mbo_msg.order_id, mbo_msg.price,
+                       mbo_msg.size, mbo_msg.flags.IsTob());
+                break;
+            }
+            default: {
+                throw std::invalid_argument{std::string{"Unknown action: "} +
+                                            ToString(mbo_msg.action)};
+            }
+        }
+    }
+
+    // Adds back a resting order, orders restored in queue order keep their priority
+    void Restore(const Order& order) {
+        Add(order.ts_event, order.side, order.id, order.price, order.size, order.is_tob);
+    }
+
+   private:
+    using LevelOrders = std::vector<Order>;
+    struct PriceAndSide {
+        int64_t price;
+        Side side;
+    };
+    using Orders = std::unordered_map<uint64_t, PriceAndSide>;
+    using SideLevels = std::map<int64_t, LevelOrders>;
+
+    static PriceLevel GetPriceLevel(int64_t price, const LevelOrders level) {
+        PriceLevel res{price};
+        for (const auto& order : level) {
+            if (!order.is_tob) {
+                ++res.count;
+            }
+            res.size += order.size;
+        }
+        return res;
+    }
+
+    static LevelOrders::iterator GetLevelOrder(LevelOrders& level, uint64_t order_id) {
+        auto order_it = std::find_if(level.begin(), level.end(), [order_id](const Order& order) {
+            return order.id == order_id;
+        });
+        if (order_it == level.end()) {
+            throw std::invalid_argument{"No order with ID " + std::to_string(order_id)};
+        }
+        return order_it;
+    }
+
+    void Touch(Side side, int64_t price) {
+        if (track_touched_) {
+            touched_.emplace(side, price);
+        }
+    }
+
+    void TouchSide(Side side) {
+        if (track_touched_) {
+            for (const auto& level : GetSideLevels(side)) {
+                touched_.emplace(side, level.first);
+            }
+        }
+    }
+
+    void Clear() {
+        TouchSide(Side::Ask);
+        TouchSide(Side::Bid);
+        orders_by_id_.clear();
+        offers_.clear();
+        bids_.clear();
+    }
+
+    void Add(UnixNanos ts_event, Side side, uint64_t order_id, int64_t price, uint32_t size,
+             bool is_tob) {
+        const Order order{order_id, ts_event, price, size, side, is_tob};
+        if (order.is_tob) {
+            TouchSide(side);
+            SideLevels& levels = GetSideLevels(side);
+            levels.clear();
+            // An undefined TOB price only means the side is empty
+            if (price == kUndefPrice) {
+                return;
+            }
+            Touch(side, price);
+            LevelOrders level = {order};
+            levels.emplace(price, level);
+        } else {
+            Touch(side, price);
+            LevelOrders& level = GetOrInsertLevel(side, price);
+            level.emplace_back(order);
+            auto res = orders_by_id_.emplace(order_id, PriceAndSide{price, side});
+            if (!res.second) {
+                throw std::invalid_argument{"Received duplicated order ID " +
+                                            std::to_string(order_id)};
+            }
+        }
+    }
+
+    void Cancel(Side side, uint64_t order_id, int64_t price, uint32_t size) {
+        LevelOrders& level = GetLevel(side, price);
+        auto order_it = GetLevelOrder(level, order_id);
+        Touch(side, price);
+        if (order_it->size < size) {
+            throw std::logic_error{"Tried to cancel more size than existed for order ID " +
+                                   std::to_string(order_id)};
+        }
+        order_it->size -= size;
+        if (order_it->size == 0) {
+            orders_by_id_.erase(order_id);
+            level.erase(order_it);
+            if (level.empty()) {
+                RemoveLevel(side, price);
+            }
+        }
+    }
+
+    void Modify(UnixNanos ts_event, Side side, uint64_t order_id, int64_t price, uint32_t size,
+                bool is_tob) {
+        auto price_side_it = orders_by_id_.find(order_id);
+        if (price_side_it == orders_by_id_.end()) {
+            // If order not found, treat it as an add
+            Add(ts_event, side, order_id, price, size, is_tob);
+            return;
+        }
+        if (price_side_it->second.side != side) {
+            throw std::logic_error{"Order " + std::to_string(order_id) + " changed side"};
+        }
+        auto prev_price = price_side_it->second.price;
+        Touch(side, prev_price);
+        Touch(side, price);
+        auto& prev_level = GetLevel(side, prev_price);
+        auto level_order_it = GetLevelOrder(prev_level, order_id);
+        if (prev_price != price) {
+            price_side_it->second.price = price;
+            // Move to new price level
+            Order order = *level_order_it;
+            prev_level.erase(level_order_it);
+            if (prev_level.empty()) {
+                RemoveLevel(side, prev_price);
+            }
+            auto& level = GetOrInsertLevel(side, price);
+            level.emplace_back(order);
+            // Update order iterator
+            level_order_it = std::prev(level.end());
+            level_order_it->price = price;
+            // Changing price loses priority
+            level_order_it->ts_event = ts_event;
+        } else if (level_order_it->size < size) {
+            LevelOrders& level = prev_level;
+            // Increasing size loses priority
+            Order order = *level_order_it;
+            level.erase(level_order_it);
+            level.emplace_back(order);
+            level_order_it = std::prev(level.end());
+            level_order_it->ts_event = ts_event;
+        }
+        level_order_it->size = size;
+    }
+
+    SideLevels& GetSideLevels(Side side) {
+        switch (side) {
+            case Side::Ask: {
+                return offers_;
+            }
+            case Side::Bid: {
+                return bids_;
+            }
+            case Side::None:
+            default: {
+                throw std::invalid_argument{"Invalid side"};
+            }
+        }
+    }
+
+    LevelOrders& GetLevel(Side side, int64_t price) {
+        SideLevels& levels = GetSideLevels(side);
+        auto level_it = levels.find(price);
+        if (level_it == levels.end()) {
+            throw std::invalid_argument{std::string{"Received event for unknown level "} +
+                                        ToString(side) + " " + PxToString(price)};
+        }
+        return level_it->second;
+    }
+
+    LevelOrders& GetOrInsertLevel(Side side, int64_t price) {
+        SideLevels& levels = GetSideLevels(side);
+        return levels[price];
+    }
+
+    void RemoveLevel(Side side, int64_t price) {
+        SideLevels& levels = GetSideLevels(side);
+        levels.erase(price);
+    }
+
+    Orders orders_by_id_;
+    SideLevels offers_;
+    SideLevels bids_;
+    bool track_touched_{false};
+    Touched touched_;
+};
+
+class Market {
+   public:
+    struct PublisherBook {
+        uint16_t publisher_id;
+        Book book;
+    };
+    // deque so the references handed out by GetBook (Python bindings, IncrementalDepth) stay
+    // valid when a later publisher's book is added
+    using PublisherBooks = std::deque<PublisherBook>;
+
+    const PublisherBooks& GetBooksByPub(uint32_t instrument_id) { return books_[instrument_id]; }
+
+    const Book& GetBook(uint32_t instrument_id, uint16_t publisher_id) {
+        const auto& books = GetBooksByPub(instrument_id);
+        auto book_it =
+            std::find_if(books.begin(), books.end(), [publisher_id](const PublisherBook& pub_book) {
+                return pub_book.publisher_id == publisher_id;
+            });
+        if (book_it == books.end()) {
+            throw std::invalid_argument{"No book for publisher ID " + std::to_string(publisher_id)};
+        }
+        return book_it->book;
+    }
+
+    std::pair<PriceLevel, PriceLevel> Bbo(uint32_t instrument_id, uint16_t publisher_id) {
+        const auto& book = GetBook(instrument_id, publisher_id);
+        return book.Bbo();
+    }
+
+    std::pair<PriceLevel, PriceLevel> AggregatedBbo(uint32_t instrument_id) {
+        PriceLevel agg_bid;
+        PriceLevel agg_ask;
+        for (const auto& pub_book : GetBooksByPub(instrument_id)) {
+            const auto bbo = pub_book.book.Bbo();
+            const auto& bid = bbo.first;
+            const auto& ask = bbo.second;
+            if (bid) {
+                if (agg_bid.IsEmpty() || bid.price > agg_bid.price) {
+                    agg_bid = bid;
+                } else if (bid.price == agg_bid.price) {
+                    agg_bid.count += bid.count;
+                    agg_bid.size += bid.size;
+                }
+            }
+            if (ask) {
+                if (agg_ask.IsEmpty() || ask.price < agg_ask.price) {
+                    agg_ask = ask;
+                } else if (ask.price == agg_ask.price) {
+                    agg_ask.count += ask.count;
+                    agg_ask.size += ask.size;
+                }
+            }
+        }
+        return {agg_bid, agg_ask};
+    }
+
+    void Apply(const MboMsg& mbo_msg) {
+        GetOrInsertBook(mbo_msg.hd.instrument_id, mbo_msg.hd.publisher_id).Apply(mbo_msg);
+    }
+
+    // Starts recording the levels changed in one book, see Book::TakeTouched
+    void TrackTouched(uint32_t instrument_id, uint16_t publisher_id) {
+        GetOrInsertBook(instrument_id, publisher_id).TrackTouched(true);
+    }
+
+    Book::Touched TakeTouched(uint32_t instrument_id, uint16_t publisher_id) {
+        return GetOrInsertBook(instrument_id, publisher_id).TakeTouched();
+    }
+
+    void Restore(uint32_t instrument_id, uint16_t publisher_id, const Order& order) {
+        GetOrInsertBook(instrument_id, publisher_id).Restore(order);
+    }
+
+   private:
+    Book& GetOrInsertBook(uint32_t instrument_id, uint16_t publisher_id) {
+        auto& instrument_books = books_[instrument_id];
+        auto book_it = std::find_if(instrument_books.begin(), instrument_books.end(),
+                                    [publisher_id](const PublisherBook& pub_book) {
+                                        return pub_book.publisher_id == publisher_id;
+                                    });
+        if (book_it == instrument_books.end()) {
+            instrument_books.emplace_back(PublisherBook{publisher_id, {}});
+            book_it = std::prev(instrument_books.end());
+        }
+        return book_it->book;
+    }
+
+    std::unordered_map<uint32_t, PublisherBooks> books_;
+};
+
+// Reader for the Market checkpoints written by phitech.helpers.sierra.CheckpointWriter:
+// header | checkpoint blocks | index | footer, all little endian
+struct CheckpointOrder {
+    uint64_t order_id;
+    uint64_t ts_event;
+    int64_t price;
+    uint32_t size;
+    char side;
+    uint8_t is_tob;
+    uint16_t reserved;
+};
+static_assert(sizeof(CheckpointOrder) == 32, "unexpected CheckpointOrder layout");
+
+struct CheckpointIndexEntry {
+    uint64_t ts_event;
+    uint64_t n_records;  // records replayed before the checkpoint, continue after these
+    uint32_t sequence;
+    uint32_t reserved;
+    uint64_t offset;
+};
+static_assert(sizeof(CheckpointIndexEntry) == 32, "unexpected CheckpointIndexEntry layout");
+
+class CheckpointFile {
+   public:
+    explicit CheckpointFile(const std::string& path) : file_(path, std::ios::binary) {
+        if (!file_) {
+            throw std::invalid_argument{"Could not open " + path};
+        }
+        char magic[4];
+        uint32_t version;
+        file_.read(magic, sizeof(magic));
+        file_.read(reinterpret_cast<char*>(&version), sizeof(version));
+        if (!file_ || std::memcmp(magic, kMagic, sizeof(magic)) != 0 || version != kVersion) {
+            throw std::invalid_argument{path + " is not a version " + std::to_string(kVersion) +
+                                        " checkpoint file"};
+        }
+        // index offset, n_checkpoints, magic, reserved
+        char footer[24];
+        file_.seekg(-static_cast<std::streamoff>(sizeof(footer)), std::ios::end);
+        file_.read(footer, sizeof(footer));
+        if (!file_ || std::memcmp(footer + 16, kMagic, sizeof(magic)) != 0) {
+            throw std::invalid_argument{path + " has no index, the writer was not closed"};
+        }
+        uint64_t index_offset;
+        uint64_t n_checkpoints;
+        std::memcpy(&index_offset, footer, sizeof(index_offset));
+        std::memcpy(&n_checkpoints, footer + 8, sizeof(n_checkpoints));
+        index_.resize(n_checkpoints);
+        file_.seekg(static_cast<std::streamoff>(index_offset));
+        file_.read(reinterpret_cast<char*>(index_.data()),
+                   n_checkpoints * sizeof(CheckpointIndexEntry));
+    }
+
+    const std::vector<CheckpointIndexEntry>& Index() const { return index_; }
+
+    // Last checkpoint taken at or before ts_event, nullptr if there is none
+    const CheckpointIndexEntry* Nearest(uint64_t ts_event) const {
+        auto entry_it = std::upper_bound(
+            index_.begin(), index_.end(), ts_event,
+            [](uint64_t ts, const CheckpointIndexEntry& entry) { return ts < entry.ts_event; });
+        if (entry_it == index_.begin()) {
+            return nullptr;
+        }
+        return &*std::prev(entry_it);
+    }
+
+    // Restores the books of a checkpoint into an empty market
+    void Load(const CheckpointIndexEntry& entry, Market& market) {
+        // ts_event, n_records, sequence, n_books
+        char block[24];
+        file_.seekg(static_cast<std::streamoff>(entry.offset));
+        file_.read(block, sizeof(block));
+        uint32_t n_books;
+        std::memcpy(&n_books, block + 20, sizeof(n_books));
+        std::vector<CheckpointOrder> orders;
+        for (uint32_t i = 0; i < n_books; ++i) {
+            // instrument_id, publisher_id, reserved, n_orders
+            char book[16];
+            file_.read(book, sizeof(book));
+            uint32_t instrument_id;
+            uint16_t publisher_id;
+            uint64_t n_orders;
+            std::memcpy(&instrument_id, book, sizeof(instrument_id));
+            std::memcpy(&publisher_id, book + 4, sizeof(publisher_id));
+            std::memcpy(&n_orders, book + 8, sizeof(n_orders));
+            orders.resize(n_orders);
+            file_.read(reinterpret_cast<char*>(orders.data()), n_orders * sizeof(CheckpointOrder));
+            if (!file_) {
+                throw std::invalid_argument{"Truncated checkpoint at offset " +
+                                            std::to_string(entry.offset)};
+            }
+            for (const auto& order : orders) {
+                market.Restore(instrument_id, publisher_id,
+                               Order{order.order_id, UnixNanos{UnixNanos::duration{order.ts_event}},
+                                     order.price, order.size, static_cast<Side>(order.side),
+                                     order.is_tob != 0});
+            }
+        }
+    }
+
+   private:
+    static constexpr char kMagic[4] = {'P', 'H', 'C', 'K'};
+    static constexpr uint32_t kVersion = 1;
+
+    std::ifstream file_;
+    std::vector<CheckpointIndexEntry> index_;
+};
+
+}  // namespace phitech
@@ -6,6 +6,7 @@ if "PYTHONPATH" not in os.environ:
 BASE_DEFINITIONS_PATH = f"{os.environ['PYTHONPATH']}/definitions"
 BASE_STRATEGIES_PATH = f"{os.environ['PYTHONPATH']}/ip/strategies"
 BASE_DATA_PATH = f"{os.environ['PYTHONPATH']}/data"
+BASE_IB_CACHE_PATH = f"{BASE_DATA_PATH}/ib-cache"
 BASE_INDICATORS_PATH = f"{os.environ['PYTHONPATH']}/ip/indicators"
 BASE_ANALYZERS_PATH = f"{os.environ['PYTHONPATH']}/ip/analyzers"
 BASE_OBSERVERS_PATH = f"{os.environ['PYTHONPATH']}/ip/observers"
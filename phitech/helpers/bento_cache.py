@@ -0,0 +1,291 @@
+from __future__ import annotations
+import hashlib
+import json
+import os
+import shutil
+
+import databento as db
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+from pyarrow import fs
+from progiter import ProgIter
+
+from phitech.helpers.sierra import (
+    list_bento_files,
+    mbo_to_scid_records,
+    unix_nanos,
+    write_scid_file,
+)
+
+# Decoded DBN files are cached under
+#
+#   <cache_dir>/<table>/<source hash>/instrument_id=<id>/date=<YYYY-MM-DD>/
+#
+# with table "mbo" (every record) or "ticks" (fills only). The hash is of the
+# file content, so a renamed file hits the cache and a redownloaded one with
+# different content does not. _manifest.json is written last, a key without it
+# is an interrupted build and is rebuilt.
+cache_tables = ("mbo", "ticks")
+cache_formats = {"parquet": "parquet", "ipc": "arrow"}
+partition_schema = pa.schema([("instrument_id", pa.uint32()), ("date", pa.string())])
+fill_dtype = np.dtype(
+    [
+        ("action", "S1"),
+        ("ts_event", "<u8"),
+        ("price", "<i8"),
+        ("size", "<u4"),
+        ("side", "S1"),
+    ]
+)
+tick_columns = [
+    "record",
+    "ts_event",
+    "publisher_id",
+    "instrument_id",
+    "price",
+    "size",
+    "side",
+    "sequence",
+]
+
+
+def file_hash(path, chunk_size=16 * 1024 * 1024) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def source_key(bento_zst_path, cache_dir) -> str:
+    # hashing a multi GB file takes a while, so hashes are remembered per
+    # (path, size, mtime) in <cache_dir>/hashes.json
+    stat = os.stat(bento_zst_path)
+    memo_path = os.path.join(cache_dir, "hashes.json")
+    memo = {}
+    if os.path.exists(memo_path):
+        with open(memo_path) as f:
+            memo = json.load(f)
+    memo_key = f"{os.path.abspath(bento_zst_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    if memo_key not in memo:
+        memo[memo_key] = file_hash(bento_zst_path)
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(f"{memo_path}.tmp", "w") as f:
+            json.dump(memo, f, indent=1)
+        os.replace(f"{memo_path}.tmp", memo_path)
+    return memo[memo_key]
+
+
+def mbo_to_table(mbo, first_record=0) -> pa.Table:
+    # DBN MBO record array (DBNStore.to_ndarray) -> arrow table, `record` is
+    # the position in the source file so the original order can be restored
+    # across partitions
+    columns = {"record": np.arange(first_record, first_record + len(mbo))}
+    for name in mbo.dtype.names:
+        if name in ("length", "rtype"):
+            continue
+        values = mbo[name]
+        if values.dtype.kind == "S":
+            values = values.astype("U1")
+        columns[name] = values
+    columns["date"] = ns_to_date(mbo["ts_event"])
+    return pa.table(columns)
+
+
+def ns_to_date(ns):
+    # UTC date partition value(s) of unix ns timestamp(s)
+    return np.asarray(ns, dtype="datetime64[ns]").astype("datetime64[D]").astype(str)
+
+
+def fills_table(mbo_table: pa.Table) -> pa.Table:
+    fills = mbo_table.filter(pc.equal(mbo_table["action"], "F"))
+    return fills.select(tick_columns + ["date"])
+
+
+def cache_dir_for(cache_dir, table, key) -> str:
+    if table not in cache_tables:
+        raise ValueError(f"Invalid {table =}, expected one of {cache_tables}")
+    return os.path.join(cache_dir, table, key)
+
+
+def build_cache(
+    bento_zst_path, cache_dir, format=None, batch_size=1_000_000, force=False
+) -> str:
+    # Decodes the file once into the mbo and ticks tables, returns the key.
+    # format="ipc" writes uncompressed arrow files, bigger on disk but read
+    # memory mapped without a decode step. None keeps an existing cache in
+    # whatever format it has and builds parquet, another format than the
+    # cached one rebuilds it.
+    if format is not None and format not in cache_formats:
+        raise ValueError(f"Invalid {format =}, expected one of {list(cache_formats)}")
+    if os.path.exists(bento_zst_path):
+        data = db.DBNStore.from_file(bento_zst_path)
+    else:
+        raise ValueError(f"data file {bento_zst_path} not found.")
+    key = source_key(bento_zst_path, cache_dir)
+    manifest_path = os.path.join(cache_dir_for(cache_dir, "mbo", key), "_manifest.json")
+    if os.path.exists(manifest_path) and not force:
+        with open(manifest_path) as f:
+            cached_format = json.load(f)["format"]
+        if format is None or format == cached_format:
+            return key
+        print(f"cache {key} is {cached_format}, rebuilding as {format}")
+    format = format or "parquet"
+    if data.schema != db.Schema.MBO:
+        raise ValueError(f"only MBO data can be cached, got {data.schema}")
+
+    print(f"cache {bento_zst_path} -> {key}")
+    targets = {table: cache_dir_for(cache_dir, table, key) for table in cache_tables}
+    for target in targets.values():
+        shutil.rmtree(target, ignore_errors=True)
+    extension = cache_formats[format]
+    n_records = n_fills = 0
+    for batch_no, mbo in enumerate(ProgIter(data.to_ndarray(count=batch_size))):
+        mbo_table = mbo_to_table(mbo, n_records)
+        ticks = fills_table(mbo_table)
+        for table, values in (("mbo", mbo_table), ("ticks", ticks)):
+            ds.write_dataset(
+                values,
+                targets[table],
+                format=format,
+                partitioning=ds.partitioning(partition_schema, flavor="hive"),
+                basename_template=f"part-{batch_no:06d}-{{i}}.{extension}",
+                existing_data_behavior="overwrite_or_ignore",
+                max_partitions=100_000,
+            )
+        n_records += len(mbo_table)
+        n_fills += len(ticks)
+
+    manifest = {
+        "source": os.path.abspath(bento_zst_path),
+        "format": format,
+        "dataset": data.metadata.dataset,
+        "start": data.start.isoformat(),
+        "end": data.end.isoformat() if data.end is not None else None,
+        "records": n_records,
+        "fills": n_fills,
+    }
+    for table in ("ticks", "mbo"):
+        os.makedirs(targets[table], exist_ok=True)
+        with open(os.path.join(targets[table], "_manifest.json"), "w") as f:
+            json.dump(manifest, f, indent=1)
+    print(f"records -> {n_records}, fills -> {n_fills}")
+    return key
+
+
+def cache_datasets(inputs, cache_dir, table="mbo", **kwargs) -> list[ds.Dataset]:
+    # one dataset per DBN file (anything list_bento_files takes), the cache
+    # is built on first use, kwargs go to build_cache. Files are opened memory
+    # mapped, so ipc caches are read zero copy.
+    filesystem = fs.LocalFileSystem(use_mmap=True)
+    datasets = []
+    for path in list_bento_files(inputs):
+        key = build_cache(path, cache_dir, **kwargs)
+        directory = cache_dir_for(cache_dir, table, key)
+        with open(os.path.join(directory, "_manifest.json")) as f:
+            format = json.load(f)["format"]
+        datasets.append(
+            ds.dataset(
+                directory,
+                format=format,
+                partitioning=ds.partitioning(partition_schema, flavor="hive"),
+                filesystem=filesystem,
+            )
+        )
+    return datasets
+
+
+def open_cache(inputs, cache_dir, table="mbo", **kwargs) -> ds.Dataset:
+    # for scans with arbitrary filters/projections, rows come partition by
+    # partition, not in file order
+    datasets = cache_datasets(inputs, cache_dir, table, **kwargs)
+    return datasets[0] if len(datasets) == 1 else ds.dataset(datasets)
+
+
+def cache_filter(instrument_id=None, start=None, end=None) -> ds.Expression | None:
+    # start/end: unix ns or datetimes (naive = UTC), half-open [start, end).
+    # The date bounds prune partitions, ts_event is pushed down to the
+    # parquet row group statistics.
+    exprs = []
+    if instrument_id is not None:
+        ids = [instrument_id] if np.isscalar(instrument_id) else list(instrument_id)
+        exprs.append(ds.field("instrument_id").isin(ids))
+    if start is not None:
+        start = unix_nanos(start)
+        exprs.append(ds.field("date") >= str(ns_to_date(start)))
+        exprs.append(ds.field("ts_event") >= start)
+    if end is not None:
+        end = unix_nanos(end)
+        exprs.append(ds.field("date") <= str(ns_to_date(end)))
+        exprs.append(ds.field("ts_event") < end)
+    if not exprs:
+        return None
+    expr = exprs[0]
+    for e in exprs[1:]:
+        expr = expr & e
+    return expr
+
+
+def read_cache(
+    inputs,
+    cache_dir,
+    table="mbo",
+    instrument_id=None,
+    start=None,
+    end=None,
+    columns=None,
+    **kwargs,
+) -> pa.Table:
+    # records in source file order, files in list_bento_files order
+    if columns is not None and "record" not in columns:
+        columns = list(columns) + ["record"]
+    expr = cache_filter(instrument_id, start, end)
+    tables = [
+        dataset.to_table(columns=columns, filter=expr).sort_by("record")
+        for dataset in cache_datasets(inputs, cache_dir, table, **kwargs)
+    ]
+    return pa.concat_tables(tables)
+
+
+def read_cache_df(*args, **kwargs) -> pd.DataFrame:
+    res = read_cache(*args, **kwargs).to_pandas()
+    if "ts_event" in res:
+        res["ts"] = pd.to_datetime(res.ts_event, unit="ns", utc=True)
+    return res
+
+
+def ticks_to_scid_records(ticks: pa.Table):
+    # cached ticks table -> the record array fields mbo_to_scid_records reads
+    fills = np.zeros(len(ticks), dtype=fill_dtype)
+    fills["action"] = b"F"
+    for name in ("ts_event", "price", "size"):
+        fills[name] = ticks[name].to_numpy()
+    fills["side"] = ticks["side"].to_numpy(zero_copy_only=False).astype("S1")
+    return mbo_to_scid_records(fills)
+
+
+def cached_bento_to_scid(
+    inputs,
+    target_path,
+    cache_dir,
+    instrument_id=None,
+    start=None,
+    end=None,
+    append=False,
+    **kwargs,
+):
+    # bento_to_scid over the ticks cache, only decodes files not cached yet
+    ticks = read_cache(
+        inputs,
+        cache_dir,
+        "ticks",
+        instrument_id,
+        start,
+        end,
+        columns=["ts_event", "price", "size", "side"],
+        **kwargs,
+    )
+    write_scid_file(ticks_to_scid_records(ticks), target_path, append=append)
@@ -6,14 +6,195 @@ from ib_insync.contract import *
 import pandas as pd
 
 import os
+import asyncio
+import contextlib
+import json
 import yaml
 import re
 import datetime
 import math
+import time
+import weakref
 from progiter import ProgIter
 
 
-def get_historical_bars_for_ticker_strings(client, ticker_strings):
+class PacingScheduler:
+    # Every IB data request of a client goes through one scheduler
+    # (scheduler_for), which keeps it within IB's historical data pacing:
+    #  - a token bucket holding `burst` tokens refilled so that no `period`
+    #    seconds see more than `max_requests` requests (60 per 10 minutes)
+    #  - at most `same_contract_requests` requests for one (contract,
+    #    exchange, whatToShow) within `same_contract_window` seconds (IB
+    #    rejects 6 within 2 seconds), burst is capped at that count too
+    #  - at most `max_concurrent` requests open at once
+    #  - identical requests in flight, or answered less than
+    #    `identical_window` seconds ago, share one result
+    #  - a request which comes back empty after a pacing violation error is
+    #    retried after `backoff` seconds, doubled every retry
+    #  - failed requests (None) are not remembered as answered
+    # Requests wait in FIFO order, so any number of them complete at the
+    # maximum allowed rate. One held back by its contract's window only
+    # waits in the queue of that contract, the others go ahead.
+    def __init__(
+        self,
+        client,
+        max_requests=60,
+        period=600,
+        burst=5,
+        max_concurrent=5,
+        identical_window=15,
+        same_contract_requests=5,
+        same_contract_window=2,
+        max_retries=5,
+        backoff=15,
+    ):
+        burst = min(burst, same_contract_requests)
+        self.capacity = burst
+        self.rate = (max_requests - burst) / period
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+        self.semaphore = asyncio.Semaphore(max_concurrent)
+        self.identical_window = identical_window
+        self.same_contract_requests = same_contract_requests
+        self.same_contract_window = same_contract_window
+        # pace key -> start times of its requests in the last window
+        self.contract_starts = {}
+        # pace key -> lock its requests queue on for their window
+        self.contract_locks = weakref.WeakValueDictionary()
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.in_flight = {}
+        self.recent = {}
+        self.violations = 0
+        # reqIds IB answered with "HMDS query returned no data"
+        self.no_data = set()
+        if hasattr(client, "errorEvent"):
+            client.errorEvent += self.on_error
+
+    def on_error(self, req_id, error_code, error_string, contract=None):
+        if "pacing violation" in error_string.lower():
+            logger.info(f"IB pacing violation -> {error_string}")
+            self.violations += 1
+            self.tokens = 0
+        elif "returned no data" in error_string.lower():
+            self.no_data.add(req_id)
+
+    async def submit(self, key, request, pace_key=None):
+        # `request` makes the IB coroutine, `key` identifies identical requests
+        # and `pace_key` the (contract, exchange, whatToShow) they count for
+        now = time.monotonic()
+        self.recent = {
+            k: v for k, v in self.recent.items() if now - v[0] < self.identical_window
+        }
+        if key in self.recent:
+            return self.recent[key][1]
+        if key not in self.in_flight:
+            self.in_flight[key] = asyncio.ensure_future(
+                self._run(key, request, pace_key)
+            )
+        return await asyncio.shield(self.in_flight[key])
+
+    async def _run(self, key, request, pace_key):
+        try:
+            for attempt in range(self.max_retries + 1):
+                async with self._contract_turn(pace_key):
+                    await self.semaphore.acquire()
+                    try:
+                        await self._take_token(pace_key)
+                    except BaseException:
+                        self.semaphore.release()
+                        raise
+                try:
+                    violations = self.violations
+                    res = await request()
+                finally:
+                    self.semaphore.release()
+                if res or self.violations == violations:
+                    if res is not None:
+                        self.recent[key] = (time.monotonic(), res)
+                    return res
+                delay = self.backoff * 2**attempt
+                logger.info(f"request {key} paced out, retrying in {delay}s")
+                await asyncio.sleep(delay)
+            raise Exception(f"IB pacing violations after {self.max_retries} retries")
+        finally:
+            del self.in_flight[key]
+
+    @contextlib.asynccontextmanager
+    async def _contract_turn(self, pace_key):
+        # the requests of a pace key wait for a free spot in its window one
+        # after another, holding nothing the other contracts need. The turn
+        # ends once the request has its token, so its start is recorded.
+        if pace_key is None:
+            yield
+            return
+        lock = self.contract_locks.get(pace_key)
+        if lock is None:
+            lock = self.contract_locks[pace_key] = asyncio.Lock()
+        async with lock:
+            while (wait := self._contract_wait(pace_key, time.monotonic())) > 0:
+                await asyncio.sleep(wait)
+            yield
+
+    async def _take_token(self, pace_key=None):
+        # every request needs a token, so they wait for one in FIFO order
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    if pace_key is not None:
+                        self.contract_starts.setdefault(pace_key, []).append(now)
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def _contract_wait(self, pace_key, now):
+        # seconds until another request for pace_key fits in its window
+        self.contract_starts = {
+            k: [t for t in v if now - t < self.same_contract_window]
+            for k, v in self.contract_starts.items()
+        }
+        self.contract_starts = {k: v for k, v in self.contract_starts.items() if v}
+        starts = self.contract_starts.get(pace_key, [])
+        if len(starts) < self.same_contract_requests:
+            return 0
+        return starts[-self.same_contract_requests] + self.same_contract_window - now
+
+
+class ConcurrencyLimit:
+    # at most `max_concurrent` requests of one call in flight, on top of the
+    # limits of the client's scheduler they are submitted to
+    def __init__(self, scheduler, max_concurrent):
+        self.scheduler = scheduler
+        self.semaphore = asyncio.Semaphore(max_concurrent)
+
+    def __getattr__(self, name):
+        return getattr(self.scheduler, name)
+
+    async def submit(self, key, request, pace_key=None):
+        async with self.semaphore:
+            return await self.scheduler.submit(key, request, pace_key)
+
+
+schedulers = weakref.WeakKeyDictionary()
+
+
+def scheduler_for(client, **kwargs):
+    # the client's shared scheduler, kwargs only apply when it is created
+    if client not in schedulers:
+        schedulers[client] = PacingScheduler(client, **kwargs)
+    return schedulers[client]
+
+
+def get_historical_bars_for_ticker_strings(
+    client, ticker_strings, what_to_show="TRADES", cache_dir=BASE_IB_CACHE_PATH
+):
+    # cache_dir=None always downloads everything from IB
     from phitech.generators.helpers import parse_ticker_string
 
     instruments = {}
@@ -26,13 +207,29 @@ def get_historical_bars_for_ticker_strings(client, ticker_strings):
         )
         client.qualifyContracts(contract)
         try:
-            current = get_historical_bars(
-                client,
-                contract,
-                start_date=start_date,
-                end_date=end_date,
-                interval=interval,
-            )
+            if cache_dir is None:
+                current = get_historical_bars(
+                    client,
+                    contract,
+                    start_date=start_date,
+                    end_date=end_date,
+                    interval=interval,
+                    what_to_show=what_to_show,
+                )
+            else:
+                current = get_historical_bars_cached(
+                    client,
+                    contract,
+                    start_date=start_date,
+                    end_date=end_date,
+                    interval=interval,
+                    what_to_show=what_to_show,
+                    cache_dir=cache_dir,
+                )
+            if current is None or current.empty:
+                raise Exception(
+                    "IB returns None, probably data is too old for interval"
+                )
             instruments[alias] = current
         except Exception as e:
             logger.info(f"exception encountered while pulling data for {ticker} -> {e}")
@@ -58,6 +255,7 @@ def insync_interval_from_bar_type(bar_type):
     return f"{size} {new_agg}"
 
 
+safe_intervals = ["hour", "day", "week", "month"]
 valid_intervals = {
     "5 secs",
     "10 secs",
@@ -74,28 +272,241 @@ valid_intervals = {
 }
 
 
-def get_historical_bars(client, contract, start_date, end_date, interval):
-    logger.info(f"getting historical bars for -> {contract.symbol}")
+def clip_bars(res, sd):
+    if res is None:
+        return None
+    if " " in str(res.index.dtype):
+        res.index = res.index.tz_convert(None)
+    return res[res.index >= sd]
+
+
+def get_historical_bars(
+    client, contract, start_date, end_date, interval, what_to_show="TRADES"
+):
+    # every chunk window is planned up front and requested independently,
+    # the scheduler runs them in parallel as far as pacing allows
+    return util.run(
+        get_historical_bars_async(
+            client, contract, start_date, end_date, interval, what_to_show
+        )
+    )
+
+
+def get_historical_bars_default(
+    client, contract, end_date, duration, interval, what_to_show="TRADES"
+):
+    bars = util.run(
+        request_historical_data(
+            client, contract, end_date, duration, interval, what_to_show
+        )
+    )
+    return bars_to_df(bars)
+
+
+def request_historical_data(
+    client, contract, end_date, duration, interval, what_to_show, scheduler=None
+):
+    scheduler = scheduler or scheduler_for(client)
+    key = (
+        "bars",
+        contract_key(contract),
+        make_date(end_date),
+        duration,
+        interval,
+        what_to_show,
+    )
+
+    async def request():
+        # bars, [] when IB answered that there is no data or None when the
+        # request failed. ib_insync returns an empty list for timeouts and
+        # errors too, only the no data error tells them apart.
+        bars = await client.reqHistoricalDataAsync(
+            contract,
+            endDateTime=make_date(end_date),
+            durationStr=duration,
+            barSizeSetting=interval,
+            whatToShow=what_to_show,
+            useRTH=True,
+            timeout=300,
+        )
+        if bars:
+            return bars
+        req_id = getattr(bars, "reqId", None)
+        if req_id in scheduler.no_data:
+            scheduler.no_data.discard(req_id)
+            return bars
+        return None
+
+    return scheduler.submit(
+        key, request, (contract_key(contract), contract.exchange, what_to_show)
+    )
+
+
+def bars_to_df(bars):
+    # None for a failed request, an empty frame when there are no bars
+    if bars is None:
+        return None
+    if not bars:
+        return pd.DataFrame(
+            columns=["open", "high", "low", "close", "volume"],
+            index=pd.DatetimeIndex([], name="date"),
+            dtype=float,
+        )
+    res = util.df(bars)
+    res["date"] = pd.to_datetime(res["date"])
+    res = res.set_index("date")
+    res = res[[c for c in res.columns if c not in ["average", "barCount"]]]
+    return res
+
+
+# Bars cache, one directory per contract/interval/whatToShow with a parquet
+# file per year and coverage.json holding the [start, end) ranges already
+# downloaded. Only the gaps of a request are pulled from IB. Coverage never
+# extends past today's midnight, the current day is always downloaded again.
+def contract_key(contract):
+    # conId is only known once the contract is qualified
+    return contract.conId or f"{contract.symbol}-{contract.secType}-{contract.exchange}"
+
+
+def bar_cache_key(contract, interval, what_to_show):
+    return f"{contract_key(contract)}_{interval.replace(' ', '')}_{what_to_show}"
+
+
+def merge_ranges(ranges):
+    res = []
+    for start, end in sorted(ranges):
+        if res and start <= res[-1][1]:
+            res[-1] = (res[-1][0], max(res[-1][1], end))
+        else:
+            res.append((start, end))
+    return res
+
+
+def missing_ranges(coverage, start, end):
+    gaps = []
+    for covered_start, covered_end in merge_ranges(coverage):
+        if covered_end <= start or covered_start >= end:
+            continue
+        if covered_start > start:
+            gaps.append((start, covered_start))
+        start = max(start, covered_end)
+    if start < end:
+        gaps.append((start, end))
+    return gaps
+
+
+def load_bar_coverage(path):
+    coverage_path = os.path.join(path, "coverage.json")
+    if not os.path.exists(coverage_path):
+        return []
+    with open(coverage_path) as f:
+        ranges = json.load(f)["ranges"]
+    return [tuple(datetime.datetime.fromisoformat(d) for d in r) for r in ranges]
+
+
+def save_bar_coverage(path, coverage):
+    coverage_path = os.path.join(path, "coverage.json")
+    ranges = [[start.isoformat(), end.isoformat()] for start, end in coverage]
+    with open(f"{coverage_path}.tmp", "w") as f:
+        json.dump({"ranges": ranges}, f, indent=1)
+    os.replace(f"{coverage_path}.tmp", coverage_path)
+
+
+def load_cached_bars(path, start, end):
+    years = range(start.year, end.year + 1)
+    parts = [
+        pd.read_parquet(os.path.join(path, f"{year}.parquet"))
+        for year in years
+        if os.path.exists(os.path.join(path, f"{year}.parquet"))
+    ]
+    if not parts:
+        return None
+    res = pd.concat(parts)
+    return res[(res.index >= start) & (res.index < end)]
+
+
+def save_cached_bars(path, bars):
+    # merged into the year files, newly downloaded bars win on overlap
+    for year, current in bars.groupby(bars.index.year):
+        year_path = os.path.join(path, f"{year}.parquet")
+        if os.path.exists(year_path):
+            current = pd.concat([pd.read_parquet(year_path), current])
+            current = current[~current.index.duplicated(keep="last")]
+        current.sort_index().to_parquet(f"{year_path}.tmp")
+        os.replace(f"{year_path}.tmp", year_path)
+
+
+def open_bar_cache(cache_dir, contract, interval, what_to_show):
+    path = os.path.join(cache_dir, bar_cache_key(contract, interval, what_to_show))
+    os.makedirs(path, exist_ok=True)
+    return path, load_bar_coverage(path)
+
+
+def store_bar_gaps(path, coverage, gaps, parts):
+    # a gap IB answered is covered, also without bars (weekends, holidays).
+    # A failed one (None) is requested again next time.
+    today = datetime.datetime.combine(datetime.date.today(), datetime.time())
+    for (gap_start, gap_end), current in zip(gaps, parts):
+        if current is None:
+            continue
+        if len(current):
+            save_cached_bars(path, current)
+        if gap_start < today:
+            coverage = merge_ranges(coverage + [(gap_start, min(gap_end, today))])
+    save_bar_coverage(path, coverage)
+    return coverage
+
+
+def get_historical_bars_cached(
+    client,
+    contract,
+    start_date,
+    end_date,
+    interval,
+    what_to_show="TRADES",
+    cache_dir=BASE_IB_CACHE_PATH,
+):
+    sd, ed = datetime.datetime.fromisoformat(
+        start_date
+    ), datetime.datetime.fromisoformat(end_date)
+    path, coverage = open_bar_cache(cache_dir, contract, interval, what_to_show)
+    gaps = missing_ranges(coverage, sd, ed)
+    logger.info(f"cached bars for -> {contract.symbol}, {len(gaps)} gaps to download")
+    failed = 0
+    for gap in gaps:
+        current = get_historical_bars(
+            client,
+            contract,
+            gap[0].strftime("%Y-%m-%d %H:%M:%S"),
+            gap[1].strftime("%Y-%m-%d %H:%M:%S"),
+            interval,
+            what_to_show,
+        )
+        coverage = store_bar_gaps(path, coverage, [gap], [current])
+        failed += current is None
+    if failed:
+        logger.info(f"{failed} gaps of {contract.symbol} failed to download")
+        return None
+    return load_cached_bars(path, sd, ed)
+
+
+# asyncio variants, every IB request goes through the client's PacingScheduler
+# which caps the requests open at once across all tickers and date chunks.
+# From sync code (or a notebook after util.startLoop) use
+# get_historical_bars_for_ticker_strings_concurrent.
+def plan_historical_bars(start_date, end_date, interval):
+    # (end_date, duration) of every request for [start_date, end_date], newest
+    # first. The windows are fixed up front so the requests are independent,
+    # overlap between them is dropped when they are put together.
     sd, ed = datetime.datetime.fromisoformat(
         start_date
     ), datetime.datetime.fromisoformat(end_date)
 
-    safe_intervals = ["hour", "day", "week", "month"]
-    for si in safe_intervals:
-        if si in interval:
-            diff_days = int((ed - sd).days) + 1
-            if diff_days >= 365:
-                duration = f"{math.ceil(diff_days / 365)} Y"
-            else:
-                duration = f"{diff_days} D"
-
-            res = get_historical_bars_default(
-                client, contract, end_date, duration, interval
-            )
-            if " " in str(res.index.dtype):
-                res.index = res.index.tz_convert(None)
-            res = res[res.index >= sd]
-            return res
+    if any(si in interval for si in safe_intervals):
+        diff_days = int((ed - sd).days) + 1
+        if diff_days >= 365:
+            return [(end_date, f"{math.ceil(diff_days / 365)} Y")]
+        return [(end_date, f"{diff_days} D")]
 
     if interval not in valid_intervals:
         raise Exception("invalid interval")
@@ -105,73 +516,369 @@ def get_historical_bars(client, contract, start_date, end_date, interval):
 
     diff = int((ed - sd).days) + 1
     max_lookback_days = 3 if "secs" in interval else 20  # if "min"
+    if diff <= max_lookback_days:
+        return [(end_date, f"{diff} D")]
+
+    n_requests = math.ceil(diff / max_lookback_days)
+    return [
+        (
+            (ed - datetime.timedelta(days=i * max_lookback_days)).strftime(
+                "%Y-%m-%d %H:%M:%S"
+            ),
+            f"{max_lookback_days} D",
+        )
+        for i in range(n_requests)
+    ]
+
+
+def concat_bars(parts):
+    # parts newest first, a bar in two windows is kept once. None when a
+    # part is missing, a partial range is never returned as complete.
+    if not parts or any(p is None for p in parts):
+        return None
+    bars = [p for p in parts if len(p)]
+    if not bars:
+        return parts[0]
+    res = pd.concat(bars[::-1])
+    return res[~res.index.duplicated(keep="last")].sort_index()
+
 
-    if diff > max_lookback_days:
-        logger.info("multipart data pull")
-        n_requests = diff // max_lookback_days + 1
-        if n_requests > 100:
-            raise Exception("too many requests required for date range")
+async def get_historical_bars_default_async(
+    client, contract, end_date, duration, interval, what_to_show, scheduler=None
+):
+    bars = await request_historical_data(
+        client, contract, end_date, duration, interval, what_to_show, scheduler
+    )
+    return bars_to_df(bars)
 
-        res = pd.DataFrame()
-        for _ in ProgIter(range(n_requests)):
-            current = get_historical_bars_default(
+
+async def get_historical_bars_async(
+    client,
+    contract,
+    start_date,
+    end_date,
+    interval,
+    what_to_show="TRADES",
+    scheduler=None,
+):
+    logger.info(f"getting historical bars for -> {contract.symbol}")
+    sd = datetime.datetime.fromisoformat(start_date)
+    requests = plan_historical_bars(start_date, end_date, interval)
+    if len(requests) > 1:
+        logger.info(f"multipart data pull -> {len(requests)} requests")
+    parts = await asyncio.gather(
+        *[
+            get_historical_bars_default_async(
+                client, contract, end, duration, interval, what_to_show, scheduler
+            )
+            for end, duration in requests
+        ]
+    )
+    for (end, duration), part in zip(requests, parts):
+        if part is None:
+            logger.info(f"request {end}, {duration} for {contract.symbol} failed")
+    return clip_bars(concat_bars(parts), sd)
+
+
+async def get_historical_bars_cached_async(
+    client,
+    contract,
+    start_date,
+    end_date,
+    interval,
+    what_to_show="TRADES",
+    cache_dir=BASE_IB_CACHE_PATH,
+    scheduler=None,
+):
+    sd, ed = datetime.datetime.fromisoformat(
+        start_date
+    ), datetime.datetime.fromisoformat(end_date)
+    path, coverage = open_bar_cache(cache_dir, contract, interval, what_to_show)
+    gaps = missing_ranges(coverage, sd, ed)
+    logger.info(f"cached bars for -> {contract.symbol}, {len(gaps)} gaps to download")
+    parts = await asyncio.gather(
+        *[
+            get_historical_bars_async(
                 client,
                 contract,
-                ed.strftime("%Y-%m-%d"),
-                f"{max_lookback_days} D",
+                gap_start.strftime("%Y-%m-%d %H:%M:%S"),
+                gap_end.strftime("%Y-%m-%d %H:%M:%S"),
                 interval,
+                what_to_show,
+                scheduler,
             )
-            if current is None:
-                raise Exception(
-                    "IB returns None, probably data is too old for interval"
-                )
-            ed = current.index.min()
-            res = pd.concat([current, res])
+            for gap_start, gap_end in gaps
+        ],
+        return_exceptions=True,
+    )
+    errors = [p for p in parts if isinstance(p, Exception)]
+    parts = [None if isinstance(p, Exception) else p for p in parts]
+    store_bar_gaps(path, coverage, gaps, parts)
+    if errors:
+        raise errors[0]
+    if any(p is None for p in parts):
+        logger.info(f"gaps of {contract.symbol} failed to download")
+        return None
+    return load_cached_bars(path, sd, ed)
+
+
+async def get_historical_bars_for_ticker_strings_async(
+    client,
+    ticker_strings,
+    what_to_show="TRADES",
+    cache_dir=BASE_IB_CACHE_PATH,
+    max_concurrent=None,
+):
+    # max_concurrent caps the requests of this call in flight, the client's
+    # scheduler still applies its own limits across all calls
+    from phitech.generators.helpers import parse_ticker_string
 
-        if " " in str(res.index.dtype):
-            res.index = res.index.tz_convert(None)
-        res = res[res.index >= sd]
-        return res
+    scheduler = scheduler_for(client)
+    if max_concurrent is not None:
+        scheduler = ConcurrencyLimit(scheduler, max_concurrent)
 
-    res = get_historical_bars_default(client, contract, end_date, f"{diff} D", interval)
-    if " " in str(res.index.dtype):
-        res.index = res.index.tz_convert(None)
-    res = res[res.index >= sd]
-    return res
+    async def pull(ticker_str):
+        ticker, utype, _, exchange, interval, alias, start_date, end_date = (
+            parse_ticker_string(ticker_str)
+        )
+        contract = Contract(
+            secType=utype, symbol=ticker, exchange=exchange, currency="USD"
+        )
+        await client.qualifyContractsAsync(contract)
+        if cache_dir is None:
+            current = await get_historical_bars_async(
+                client,
+                contract,
+                start_date,
+                end_date,
+                interval,
+                what_to_show,
+                scheduler,
+            )
+        else:
+            current = await get_historical_bars_cached_async(
+                client,
+                contract,
+                start_date,
+                end_date,
+                interval,
+                what_to_show,
+                cache_dir,
+                scheduler,
+            )
+        if current is None or current.empty:
+            raise Exception("IB returns None, probably data is too old for interval")
+        return alias, current
+
+    results = await asyncio.gather(
+        *[pull(ticker_str) for ticker_str in ticker_strings], return_exceptions=True
+    )
+    for ticker_str, res in zip(ticker_strings, results):
+        if isinstance(res, Exception):
+            logger.info(
+                f"exception encountered while pulling data for {ticker_str} -> {res}"
+            )
+            return None
+    return dict(results)
 
 
-def get_historical_bars_default(client, contract, end_date, duration, interval):
-    res = client.reqHistoricalData(
-        contract,
-        endDateTime=make_date(end_date),
-        durationStr=duration,
-        barSizeSetting=interval,
-        whatToShow="TRADES",
-        useRTH=True,
-        timeout=300,
+def get_historical_bars_for_ticker_strings_concurrent(client, ticker_strings, **kwargs):
+    return util.run(
+        get_historical_bars_for_ticker_strings_async(client, ticker_strings, **kwargs)
     )
-    res = util.df(res)
-    res["date"] = pd.to_datetime(res["date"])
-    res = res.set_index("date")
-    res = res[[c for c in res.columns if c not in ["average", "barCount"]]]
-    return res
 
 
 def get_historical_ticks(
     client, contract, start_date, end_date, what_to_show="TRADES", number_of_ticks=1000
 ):
-    res = client.reqHistoricalTicks(
-        contract=contract,
-        startDateTime=make_date(start_date),
-        endDateTime=make_date(end_date),
-        whatToShow=what_to_show,  # BID_ASK, MIDPOINT, TRADES,
-        numberOfTicks=number_of_ticks,
-        useRth=True,
+    key = (
+        "ticks",
+        contract_key(contract),
+        make_date(start_date),
+        make_date(end_date),
+        what_to_show,
+        number_of_ticks,
+    )
+    res = util.run(
+        scheduler_for(client).submit(
+            key,
+            lambda: client.reqHistoricalTicksAsync(
+                contract=contract,
+                startDateTime=make_date(start_date),
+                endDateTime=make_date(end_date),
+                whatToShow=what_to_show,  # BID_ASK, MIDPOINT, TRADES,
+                numberOfTicks=number_of_ticks,
+                useRth=True,
+            ),
+            (contract_key(contract), contract.exchange, what_to_show),
+        )
     )
     res = util.df(res)
     return res
 
 
+# Full tick history, IB only returns up to 1000 ticks per request. Pages are
+# requested forward from the last tick received, every page starts with the
+# ticks of the second the previous one ended in, those already written are
+# skipped. Pages are streamed to a parquet file, a row group every
+# `flush_pages` pages, optionally to a .scid file too.
+tick_types = ("TRADES", "BID_ASK", "MIDPOINT")
+
+
+def ticks_to_df(ticks, what_to_show):
+    res = {"time": [pd.Timestamp(t.time).value for t in ticks]}
+    if what_to_show == "TRADES":
+        res["price"] = [t.price for t in ticks]
+        res["size"] = [float(t.size) for t in ticks]
+        res["exchange"] = [t.exchange for t in ticks]
+        res["special_conditions"] = [t.specialConditions for t in ticks]
+        res["past_limit"] = [t.tickAttribLast.pastLimit for t in ticks]
+        res["unreported"] = [t.tickAttribLast.unreported for t in ticks]
+    elif what_to_show == "BID_ASK":
+        res["bid_price"] = [t.priceBid for t in ticks]
+        res["ask_price"] = [t.priceAsk for t in ticks]
+        res["bid_size"] = [float(t.sizeBid) for t in ticks]
+        res["ask_size"] = [float(t.sizeAsk) for t in ticks]
+        res["bid_past_low"] = [t.tickAttribBidAsk.bidPastLow for t in ticks]
+        res["ask_past_high"] = [t.tickAttribBidAsk.askPastHigh for t in ticks]
+    else:
+        res["price"] = [t.price for t in ticks]
+        res["size"] = [float(t.size) for t in ticks]
+    return pd.DataFrame(res)
+
+
+def tick_df_to_scid_records(ticks):
+    # TRADES and MIDPOINT ticks as sierra tick records (open == 0), IB ticks
+    # carry no aggressor side so bid/ask volume stay 0
+    from phitech.helpers.sierra import intraday_rec_dtype, unix_ns_to_sierra
+
+    recs = pd.DataFrame(
+        {
+            "timestamp": unix_ns_to_sierra(ticks.time.to_numpy()),
+            "open": 0.0,
+            "high": ticks.price,
+            "low": ticks.price,
+            "close": ticks.price,
+            "num_trades": 1,
+            "total_vol": ticks["size"].round().astype("uint32"),
+            "bid_vol": 0,
+            "ask_vol": 0,
+        }
+    )
+    return recs.to_records(index=False).astype(intraday_rec_dtype)
+
+
+async def download_historical_ticks_async(
+    client,
+    contract,
+    start_date,
+    end_date,
+    target_path,
+    what_to_show="TRADES",
+    scid_path=None,
+    use_rth=True,
+    flush_pages=50,
+    scheduler=None,
+):
+    # start/end: anything pandas parses, naive dates are UTC, [start, end)
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if what_to_show not in tick_types:
+        raise ValueError(f"Invalid {what_to_show =}, expected one of {tick_types}")
+    if scid_path is not None and what_to_show == "BID_ASK":
+        raise ValueError("SCID output needs TRADES or MIDPOINT ticks")
+    scheduler = scheduler or scheduler_for(client)
+    start, end = pd.Timestamp(start_date), pd.Timestamp(end_date)
+    start = start.tz_localize("UTC") if start.tzinfo is None else start
+    end = end.tz_localize("UTC") if end.tzinfo is None else end
+    logger.info(f"getting {what_to_show} ticks for -> {contract.symbol}")
+
+    writer = scid_writer = None
+    if scid_path is not None:
+        from phitech.helpers.sierra import ScidWriter
+
+        scid_writer = ScidWriter(scid_path)
+    buffer = []
+    n_pages = n_ticks = 0
+    last_time, n_at_last = None, 0
+
+    def flush():
+        nonlocal writer, buffer
+        if not buffer:
+            return
+        df = ticks_to_df(buffer, what_to_show)
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if writer is None:
+            writer = pq.ParquetWriter(target_path, table.schema)
+        writer.write_table(table.cast(writer.schema))
+        if scid_writer is not None:
+            scid_writer.write(tick_df_to_scid_records(df))
+        buffer = []
+
+    try:
+        page_start = start.to_pydatetime()
+        while True:
+            key = ("ticks", contract_key(contract), page_start, what_to_show, use_rth)
+            page = await scheduler.submit(
+                key,
+                lambda: client.reqHistoricalTicksAsync(
+                    contract,
+                    startDateTime=page_start,
+                    endDateTime="",
+                    numberOfTicks=1000,
+                    whatToShow=what_to_show,
+                    useRth=use_rth,
+                ),
+                (contract_key(contract), contract.exchange, what_to_show),
+            )
+            n_pages += 1
+            if not page:
+                break
+            page = list(page)
+            skip = 0
+            while skip < min(n_at_last, len(page)) and page[skip].time == last_time:
+                skip += 1
+            ticks = [t for t in page[skip:] if t.time < end]
+            buffer.extend(ticks)
+            n_ticks += len(ticks)
+            if n_pages % flush_pages == 0:
+                flush()
+
+            # IB completes the last second, a short page means nothing is left
+            page_end = page[-1].time
+            if len(page) < 1000 or page_end >= end:
+                break
+            if page_end == last_time:
+                # more than a page of ticks within one second, IB can not
+                # page through it, the rest of that second is skipped
+                logger.info(f"over 1000 ticks at {page_end}, skipping the rest")
+                page_start = page_end + datetime.timedelta(seconds=1)
+                last_time, n_at_last = None, 0
+                continue
+            last_time = page_end
+            n_at_last = sum(1 for t in page if t.time == page_end)
+            page_start = page_end
+        flush()
+    finally:
+        if writer is not None:
+            writer.close()
+        if scid_writer is not None:
+            scid_writer.close()
+    logger.info(f"{n_ticks} ticks in {n_pages} pages -> {target_path}")
+    return n_ticks
+
+
+def download_historical_ticks(
+    client, contract, start_date, end_date, target_path, **kwargs
+):
+    return util.run(
+        download_historical_ticks_async(
+            client, contract, start_date, end_date, target_path, **kwargs
+        )
+    )
+
+
 def get_client(mode="paper_gateway", client_id=2):
     util.startLoop()
     client = IB()
@@ -201,12 +908,18 @@ def get_news(client, contract, start_date=None, end_date=None):
     providers = "+".join([provider.code for provider in client.reqNewsProviders()])
     logger.info(f"getting news from providers -> {providers}")
 
-    news = client.reqHistoricalNews(
-        contract.conId,
-        providerCodes=providers,
-        startDateTime=start_date,
-        endDateTime=end_date,
-        totalResults=100,
+    key = ("news", contract.conId, providers, start_date, end_date)
+    news = util.run(
+        scheduler_for(client).submit(
+            key,
+            lambda: client.reqHistoricalNewsAsync(
+                contract.conId,
+                providerCodes=providers,
+                startDateTime=start_date,
+                endDateTime=end_date,
+                totalResults=100,
+            ),
+        )
     )
     res = [
         (article.time, re.sub(r"{.*?}", "", article.headline)[1:]) for article in news
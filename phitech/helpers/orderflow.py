@@ -0,0 +1,267 @@
+from __future__ import annotations
+import os
+
+import databento as db
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from databento_dbn import FIXED_PRICE_SCALE, UNDEF_PRICE
+from progiter import ProgIter
+
+from phitech.helpers.sierra import Market, unix_nanos
+
+# float features computed from the top `levels` levels of the book at a sample
+book_features = [
+    "mid",
+    "spread",
+    "imbalance",
+    "depth_imbalance",
+    "microprice",
+    "depth_weighted_mid",
+]
+# counters accumulated over the events between two samples
+flow_features = [
+    "bid_depletion",
+    "ask_depletion",
+    "trade_throughs",
+]
+all_features = book_features + flow_features
+
+
+class OrderFlowFeatures:
+    # Replays MBO through a Market and samples order flow features of one
+    # book into numpy buffers, flushed to parquet every `buffer_size` rows.
+    #
+    # sampling="event" takes a sample after every F_LAST record of the book,
+    # sampling="time" one per `interval` (ns or a pandas Timedelta string) of
+    # ts_event, taken with the state before the first event past the boundary.
+    #
+    # imbalance           (bid_sz - ask_sz) / (bid_sz + ask_sz) at the top
+    # depth_imbalance     same over the top `levels` levels
+    # microprice          size weighted mid, leaning towards the thinner side
+    # depth_weighted_mid  mid of the bid and ask VWAP over `levels` levels
+    # bid/ask_depletion   size cancelled or filled at the best level
+    # trade_throughs      trades priced through the opposite best level
+    def __init__(
+        self,
+        instrument_id: int,
+        publisher_id: int,
+        features: list[str] | None = None,
+        levels: int = 5,
+        sampling: str = "event",
+        interval=None,
+        path=None,
+        buffer_size: int = 100_000,
+        market: Market | None = None,
+    ):
+        features = all_features if features is None else list(features)
+        unknown = set(features) - set(all_features)
+        if unknown:
+            raise ValueError(f"Unknown features {sorted(unknown)}")
+        if sampling not in ("event", "time"):
+            raise ValueError(f"Invalid {sampling =}")
+        if sampling == "time" and interval is None:
+            raise ValueError("time sampling needs an interval")
+        self.instrument_id = instrument_id
+        self.publisher_id = publisher_id
+        self.features = features
+        self.levels = levels
+        self.sampling = sampling
+        self.interval_ns = None
+        if interval is not None:
+            self.interval_ns = int(pd.Timedelta(interval).value)
+        self.path = path
+        self.market = Market() if market is None else market
+        self.book = self.market.get_book(instrument_id, publisher_id)
+
+        self.buffer_size = buffer_size
+        self.ts = np.zeros(buffer_size, dtype=np.int64)
+        self.columns = {name: np.zeros(buffer_size) for name in features}
+        self.n_rows = 0
+        self.n_flushed = 0
+        self.writer = None
+        # set by close(), a closed parquet file can not be appended to
+        self.closed = False
+        # flushed tables, only kept when there is no parquet path
+        self.tables = []
+
+        self.next_sample_ts = None
+        self.flow = dict.fromkeys(flow_features, 0)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def apply(self, mbo: db.MBOMsg):
+        if self.closed:
+            raise ValueError(f"{self.path} is closed, no more samples can be added")
+        ours = (
+            mbo.instrument_id == self.instrument_id
+            and mbo.publisher_id == self.publisher_id
+        )
+        if self.sampling == "time":
+            self._sample_until(mbo.ts_event)
+        if ours and mbo.action == "T":
+            # the book is still the pre-trade one, the resting side is only
+            # cancelled by the records which follow the trade
+            self._count_trade(mbo)
+        self.market.apply(mbo)
+        if not ours:
+            return
+        if mbo.action == "C":
+            self._count_depletion(mbo)
+        if self.sampling == "event" and mbo.flags & db.RecordFlags.F_LAST:
+            self._sample(mbo.ts_event)
+
+    def close(self):
+        self.flush()
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        if self.path is not None:
+            self.closed = True
+
+    def flush(self):
+        if not self.n_rows:
+            return
+        n = self.n_rows
+        table = pa.table(
+            {"ts_event": self.ts[:n].copy()}
+            | {name: values[:n].copy() for name, values in self.columns.items()}
+        )
+        if self.path is None:
+            self.tables.append(table)
+        else:
+            if self.writer is None:
+                self.writer = pq.ParquetWriter(self.path, table.schema)
+            self.writer.write_table(table)
+        self.n_flushed += n
+        self.n_rows = 0
+
+    def to_df(self) -> pd.DataFrame:
+        # everything sampled so far, from memory or read back from parquet.
+        # With a path this closes the file (only a closed one can be read), so
+        # call it once the replay is done.
+        if self.path is None:
+            self.flush()
+        else:
+            self.close()
+        if not self.n_flushed:
+            return pd.DataFrame(columns=["ts_event"] + self.features)
+        if self.path is None:
+            table = pa.concat_tables(self.tables)
+        else:
+            table = pq.read_table(self.path)
+        res = table.to_pandas()
+        res["ts"] = pd.to_datetime(res.ts_event, unit="ns", utc=True)
+        return res
+
+    def _sample_until(self, ts_event: int):
+        if self.next_sample_ts is None:
+            self.next_sample_ts = (ts_event // self.interval_ns + 1) * self.interval_ns
+            return
+        if ts_event < self.next_sample_ts:
+            return
+        # state is unchanged over empty intervals, one row per boundary
+        boundaries = np.arange(self.next_sample_ts, ts_event + 1, self.interval_ns)
+        for ts in boundaries:
+            self._sample(int(ts))
+        self.next_sample_ts = int(boundaries[-1]) + self.interval_ns
+
+    def _sample(self, ts_event: int):
+        if self.n_rows == self.buffer_size:
+            self.flush()
+        row = self.n_rows
+        self.ts[row] = ts_event
+        values = self._book_features() | self.flow
+        for name, column in self.columns.items():
+            column[row] = values[name]
+        self.flow = dict.fromkeys(flow_features, 0)
+        self.n_rows += 1
+
+    def _book_features(self) -> dict[str, float]:
+        snapshot = self.book.get_snapshot(self.levels)
+        bid_px = np.array([b.bid_px for b in snapshot], dtype=np.int64)
+        ask_px = np.array([b.ask_px for b in snapshot], dtype=np.int64)
+        bid_sz = np.array([b.bid_sz for b in snapshot], dtype=np.float64)
+        ask_sz = np.array([b.ask_sz for b in snapshot], dtype=np.float64)
+        bid_ok, ask_ok = bid_px != UNDEF_PRICE, ask_px != UNDEF_PRICE
+        if not (bid_ok[0] and ask_ok[0]):
+            return dict.fromkeys(book_features, np.nan)
+        bid = bid_px / FIXED_PRICE_SCALE
+        ask = ask_px / FIXED_PRICE_SCALE
+        bid_depth = bid_sz[bid_ok].sum()
+        ask_depth = ask_sz[ask_ok].sum()
+        top = bid_sz[0] + ask_sz[0]
+        return {
+            "mid": (bid[0] + ask[0]) / 2,
+            "spread": ask[0] - bid[0],
+            "imbalance": (bid_sz[0] - ask_sz[0]) / top,
+            "depth_imbalance": (bid_depth - ask_depth) / (bid_depth + ask_depth),
+            "microprice": (bid[0] * ask_sz[0] + ask[0] * bid_sz[0]) / top,
+            "depth_weighted_mid": (
+                (bid[bid_ok] * bid_sz[bid_ok]).sum() / bid_depth
+                + (ask[ask_ok] * ask_sz[ask_ok]).sum() / ask_depth
+            )
+            / 2,
+        }
+
+    def _count_trade(self, mbo: db.MBOMsg):
+        bid, ask = self.book.bbo()
+        # side is the aggressor, a buy priced above the best ask went through it
+        if mbo.side == "B" and ask is not None and mbo.price > ask.price:
+            self.flow["trade_throughs"] += 1
+        elif mbo.side == "A" and bid is not None and mbo.price < bid.price:
+            self.flow["trade_throughs"] += 1
+
+    def _count_depletion(self, mbo: db.MBOMsg):
+        # after the update the best level is at or behind the cancelled price
+        # only if the cancel was at the best level
+        bid, ask = self.book.bbo()
+        if mbo.side == "B" and (bid is None or mbo.price >= bid.price):
+            self.flow["bid_depletion"] += mbo.size
+        elif mbo.side == "A" and (ask is None or mbo.price <= ask.price):
+            self.flow["ask_depletion"] += mbo.size
+
+
+def bento_to_features(
+    bento_zst_path,
+    target_path,
+    instrument_id=None,
+    publisher_id=None,
+    **kwargs,
+):
+    # parquet time series of OrderFlowFeatures for one book of the file, the
+    # first record's by default. kwargs go to OrderFlowFeatures.
+    if os.path.exists(bento_zst_path):
+        data = db.DBNStore.from_file(bento_zst_path)
+    else:
+        raise ValueError(f"data file {bento_zst_path} not found.")
+    if instrument_id is None or publisher_id is None:
+        for first in data:
+            break
+        instrument_id, publisher_id = first.instrument_id, first.publisher_id
+    print(f"instrument_id -> {instrument_id}")
+    print(f"publisher_id -> {publisher_id}")
+    with OrderFlowFeatures(
+        instrument_id, publisher_id, path=target_path, **kwargs
+    ) as features:
+        for mbo in ProgIter(data):
+            features.apply(mbo)
+    print(f"rows written -> {features.n_flushed}")
+    return target_path
+
+
+def read_features(path, start=None, end=None) -> pd.DataFrame:
+    # start/end: unix ns or datetimes (naive = UTC), half-open [start, end)
+    filters = []
+    if start is not None:
+        filters.append(("ts_event", ">=", unix_nanos(start)))
+    if end is not None:
+        filters.append(("ts_event", "<", unix_nanos(end)))
+    res = pq.read_table(path, filters=filters or None).to_pandas()
+    res["ts"] = pd.to_datetime(res.ts_event, unit="ns", utc=True)
+    return res
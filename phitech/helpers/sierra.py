@@ -2,7 +2,7 @@ from __future__ import annotations
 import numpy as np
 from numpy import datetime64, timedelta64
 import pandas as pd
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, timedelta
 from enum import IntEnum
 from numpy import datetime64, timedelta64
 from os import fstat
@@ -12,11 +12,30 @@ from progiter import ProgIter
 
 import os
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from dataclasses import dataclass, field
+import heapq
+import re
+from pathlib import Path
+from itertools import groupby, islice
+from typing import Callable, Iterator
 import databento as db
-from databento_dbn import FIXED_PRICE_SCALE, UNDEF_PRICE, BidAskPair
+from databento_dbn import (
+    FIXED_PRICE_SCALE,
+    UNDEF_PRICE,
+    BidAskPair,
+    DBNDecoder,
+    VersionUpgradePolicy,
+)
 from sortedcontainers import SortedDict
 
+try:
+    # native book engine from bento-cpp (cmake -DBUILD_PYTHON_BINDINGS=ON), same
+    # API as `Market` plus `apply_many` for DBN buffers / record arrays
+    from bento_book import Market as NativeMarket
+except ImportError:
+    NativeMarket = None
+
 
 @dataclass
 class Order:
@@ -28,21 +47,71 @@ class Order:
     is_tob: bool = field(default=False)
 
 
+class OrderQueue:
+    # FIFO queue of a level's orders keyed by order id. Relies on dict insertion
+    # order, so removing an order (or moving it to the back) is O(1) instead of
+    # a linear `list.remove` scan.
+    def __init__(self, orders: list[Order] | None = None):
+        self.orders_by_id: dict[int, Order] = {}
+        for order in orders or []:
+            self.append(order)
+
+    def append(self, order: Order):
+        self.orders_by_id[order.id] = order
+
+    def remove(self, order: Order):
+        del self.orders_by_id[order.id]
+
+    def __iter__(self):
+        return iter(self.orders_by_id.values())
+
+    def __len__(self) -> int:
+        return len(self.orders_by_id)
+
+    def __bool__(self) -> bool:
+        return bool(self.orders_by_id)
+
+    def __repr__(self) -> str:
+        return f"OrderQueue({list(self)})"
+
+
 @dataclass
 class LevelOrders:
     price: int
-    orders: list[Order] = field(default_factory=list, compare=False)
+    orders: OrderQueue = field(default_factory=OrderQueue, compare=False)
+    # running totals, kept up to date by add/remove/resize
+    size: int = field(default=0, init=False)
+    count: int = field(default=0, init=False)
+
+    def __post_init__(self):
+        self.size = sum(o.size for o in self.orders)
+        self.count = sum(1 for o in self.orders if not o.is_tob)
 
     def __bool__(self) -> bool:
         return bool(self.orders)
 
     @property
     def level(self) -> PriceLevel:
-        return PriceLevel(
-            price=self.price,
-            count=sum(1 for o in self.orders if not o.is_tob),
-            size=sum(o.size for o in self.orders),
-        )
+        return PriceLevel(price=self.price, count=self.count, size=self.size)
+
+    def add(self, order: Order):
+        self.orders.append(order)
+        self.size += order.size
+        self.count += not order.is_tob
+
+    def remove(self, order: Order):
+        self.orders.remove(order)
+        self.size -= order.size
+        self.count -= not order.is_tob
+
+    def resize(self, order: Order, size: int):
+        self.size += size - order.size
+        order.size = size
+
+    def requeue(self, order: Order):
+        # move to the back of the queue, totals are unchanged
+        self.orders.remove(order)
+        self.orders.append(order)
 
 
 @dataclass
@@ -56,15 +125,46 @@ class PriceLevel:
         return f"{self.size:4} @ {price:6.2f} | {self.count:2} order(s)"
 
 
+def reset_snapshot(snapshot: list[BidAskPair], level_count: int) -> list[BidAskPair]:
+    # grow the preallocated pairs as needed and reset them to empty levels
+    while len(snapshot) < level_count:
+        snapshot.append(BidAskPair())
+    snapshots = snapshot[:level_count]
+    for ba_pair in snapshots:
+        ba_pair.bid_px = ba_pair.ask_px = UNDEF_PRICE
+        ba_pair.bid_sz = ba_pair.ask_sz = ba_pair.bid_ct = ba_pair.ask_ct = 0
+    return snapshots
+
+
 @dataclass
 class Book:
     orders_by_id: dict[int, Order] = field(default_factory=dict)
     offers: SortedDict[int, LevelOrders] = field(default_factory=SortedDict)
     bids: SortedDict[int, LevelOrders] = field(default_factory=SortedDict)
+    # BidAskPair objects reused by get_snapshot, copy them to keep a snapshot
+    snapshot: list[BidAskPair] = field(default_factory=list, repr=False, compare=False)
+    # with track_touched, (side, price) of every level changed since the
+    # consumer last reset `touched` (see IncrementalDepth)
+    track_touched: bool = False
+    touched: set[tuple[str, int]] = field(
+        default_factory=set, repr=False, compare=False
+    )
 
     def bbo(self) -> tuple[PriceLevel | None, PriceLevel | None]:
         return self.get_bid_level(), self.get_ask_level()
 
+    def level_count(self, side: str) -> int:
+        return len(self._side_levels(side))
+
+    def get_orders(self) -> list[Order]:
+        # resting orders (TOB ones included) level by level in queue order
+        return [
+            order
+            for levels in (self.bids, self.offers)
+            for level in levels.values()
+            for order in level.orders
+        ]
+
     def get_bid_level(self, idx: int = 0) -> PriceLevel | None:
         if self.bids and len(self.bids) > idx:
             # Reverse for bids to get highest prices first
@@ -76,6 +176,11 @@ class Book:
             return self.offers.peekitem(idx)[1].level
         return None
 
+    def iter_prices(self, side: str) -> Iterator[int]:
+        # prices of the levels of a side, best first
+        levels = self._side_levels(side)
+        return reversed(levels) if side == "B" else iter(levels)
+
     def get_bid_level_by_px(self, px: int) -> PriceLevel | None:
         try:
             return self._get_level(px, "B").level
@@ -89,20 +194,18 @@ class Book:
             return None
 
     def get_snapshot(self, level_count: int = 1) -> list[BidAskPair]:
-        snapshots = []
-        for level in range(level_count):
-            ba_pair = BidAskPair()
-            bid = self.get_bid_level(level)
-            if bid:
-                ba_pair.bid_px = bid.price
-                ba_pair.bid_sz = bid.size
-                ba_pair.bid_ct = bid.count
-            ask = self.get_ask_level(level)
-            if ask:
-                ba_pair.ask_px = ask.price
-                ba_pair.ask_sz = ask.size
-                ba_pair.ask_ct = ask.count
-            snapshots.append(ba_pair)
+        snapshots = reset_snapshot(self.snapshot, level_count)
+        # Reverse for bids to get highest prices first
+        bids = islice(reversed(self.bids.values()), level_count)
+        for ba_pair, bid in zip(snapshots, bids):
+            ba_pair.bid_px = bid.price
+            ba_pair.bid_sz = bid.size
+            ba_pair.bid_ct = bid.count
+        asks = islice(self.offers.values(), level_count)
+        for ba_pair, ask in zip(snapshots, asks):
+            ba_pair.ask_px = ask.price
+            ba_pair.ask_sz = ask.size
+            ba_pair.ask_ct = ask.count
         return snapshots
 
     def apply(
@@ -126,6 +229,7 @@ class Book:
         assert side == "A" or side == "B"
         # UNDEF_PRICE indicates the book level should be removed
         if price == UNDEF_PRICE and flags & db.RecordFlags.F_TOB:
+            self._touch_side(side)
             self._side_levels(side).clear()
             return
         # Add: insert a new order
@@ -141,10 +245,20 @@ class Book:
             raise ValueError(f"Unknown {action =}")
 
     def _clear(self):
+        self._touch_side("A")
+        self._touch_side("B")
         self.orders_by_id.clear()
         self.offers.clear()
         self.bids.clear()
 
+    def _touch(self, side: str, price: int):
+        if self.track_touched:
+            self.touched.add((side, price))
+
+    def _touch_side(self, side: str):
+        if self.track_touched:
+            self.touched.update((side, price) for price in self._side_levels(side))
+
     def _add(
         self,
         ts_event: int,
@@ -162,15 +276,17 @@ class Book:
             ts_event,
             is_tob=bool(flags & db.RecordFlags.F_TOB),
         )
+        self._touch(side, price)
         if order.is_tob:
+            self._touch_side(side)
             levels = self._side_levels(side)
             levels.clear()
-            levels[price] = LevelOrders(price=price, orders=[order])
+            levels[price] = LevelOrders(price=price, orders=OrderQueue([order]))
         else:
             level = self._get_or_insert_level(price, side)
             assert order_id not in self.orders_by_id
             self.orders_by_id[order_id] = order
-            level.orders.append(order)
+            level.add(order)
 
     def _cancel(
         self,
@@ -181,12 +297,13 @@ class Book:
     ):
         order = self.orders_by_id[order_id]
         level = self._get_level(price, side)
+        self._touch(side, price)
         assert order.size >= size
-        order.size -= size
+        level.resize(order, order.size - size)
         # If the full size is cancelled, remove the order from the book
         if order.size == 0:
             self.orders_by_id.pop(order_id)
-            level.orders.remove(order)
+            level.remove(order)
             # If the level is now empty, remove it from the book
             if not level:
                 self._remove_level(price, side)
@@ -208,20 +325,21 @@ class Book:
             return
         assert order.side == side, f"Order {order} changed side to {side}"
         prev_level = self._get_level(order.price, side)
+        self._touch(side, order.price)
+        self._touch(side, price)
         if order.price != price:
-            prev_level.orders.remove(order)
+            prev_level.remove(order)
             if not prev_level:
                 self._remove_level(order.price, side)
             level = self._get_or_insert_level(price, side)
-            level.orders.append(order)
+            level.add(order)
         else:
             level = prev_level
         # The order loses its priority if the price changes or the size increases
         if order.price != price or order.size < size:
             order.ts_event = ts_event
-            level.orders.remove(order)
-            level.orders.append(order)
-        order.size = size
+            level.requeue(order)
+        level.resize(order, size)
         order.price = price
 
     def _side_levels(self, side: str) -> SortedDict:
@@ -250,11 +368,513 @@ class Book:
         levels.pop(price)
 
 
+BID, ASK = 0, 1
+side_index = {"B": BID, "A": ASK}
+side_chars = "BA"
+
+
+@dataclass
+class ArrayBook:
+    # Same API as `Book` but only keeps aggregated size/count per level in
+    # tick-indexed arrays (idx = price / tick_size - ref_tick) plus a compact
+    # order table, so a snapshot of N levels is an array slice.
+    # `tick_size` is in fixed-price units and must divide every price.
+    # The window grows up to `max_ticks`, orders priced further away (fat
+    # fingers, stale quotes) go to a plain `Book` in `overflow`.
+
+    tick_size: int = FIXED_PRICE_SCALE // 100
+    n_ticks: int = 4096
+    max_ticks: int = 1 << 16
+    ref_tick: int | None = None
+    order_capacity: int = 1024
+    track_touched: bool = False
+
+    def __post_init__(self):
+        self.snapshot: list[BidAskPair] = []
+        self.overflow = Book()
+        self.touched: set[tuple[str, int]] = set()
+        # rows are indexed by side (BID, ASK)
+        self.sizes = np.zeros((2, self.n_ticks), dtype=np.int64)
+        self.counts = np.zeros((2, self.n_ticks), dtype=np.int64)
+        # number of resting orders including TOB ones, used for level presence
+        self.depths = np.zeros((2, self.n_ticks), dtype=np.int64)
+        self.best = [-1, -1]
+        self.n_levels = [0, 0]
+
+        self.slots_by_id: dict[int, int] = {}
+        self.free_slots: list[int] = []
+        self.order_price = np.zeros(self.order_capacity, dtype=np.int64)
+        self.order_size = np.zeros(self.order_capacity, dtype=np.int64)
+        self.order_ts_event = np.zeros(self.order_capacity, dtype=np.int64)
+        self.order_side = np.zeros(self.order_capacity, dtype=np.int8)
+        # increases on every add/requeue, orders a level's queue on ts_event ties
+        self.order_seq = np.zeros(self.order_capacity, dtype=np.int64)
+        self.n_slots = 0
+        self.next_seq = 0
+
+    def bbo(self) -> tuple[PriceLevel | None, PriceLevel | None]:
+        return self.get_bid_level(), self.get_ask_level()
+
+    @property
+    def touched(self) -> set[tuple[str, int]]:
+        return self._touched
+
+    @touched.setter
+    def touched(self, value: set[tuple[str, int]]):
+        # one set shared with the overflow book
+        self._touched = value
+        self.overflow.touched = value
+
+    def level_count(self, side: str) -> int:
+        return self.n_levels[side_index[side]] + self.overflow.level_count(side)
+
+    def get_bid_level(self, idx: int = 0) -> PriceLevel | None:
+        return self._nth_level(BID, idx)
+
+    def get_ask_level(self, idx: int = 0) -> PriceLevel | None:
+        return self._nth_level(ASK, idx)
+
+    def get_bid_level_by_px(self, px: int) -> PriceLevel | None:
+        return self._level_by_px(BID, px)
+
+    def get_ask_level_by_px(self, px: int) -> PriceLevel | None:
+        return self._level_by_px(ASK, px)
+
+    def get_orders(self) -> list[Order]:
+        # resting orders per level in queue order, like Book.get_orders. TOB
+        # levels are not tracked by order, they come back as one order with
+        # id 0 and ts_event 0.
+        slots = np.fromiter(self.slots_by_id.values(), dtype=np.int64)
+        ids = np.fromiter(self.slots_by_id.keys(), dtype=np.uint64)
+        queue = np.lexsort(
+            (
+                self.order_seq[slots],
+                self.order_price[slots],
+                self.order_side[slots],
+            )
+        )
+        slots, ids = slots[queue], ids[queue]
+        orders = [
+            Order(order_id, side_chars[side], price, size, ts_event)
+            for order_id, side, price, size, ts_event in zip(
+                ids.tolist(),
+                self.order_side[slots].tolist(),
+                self.order_price[slots].tolist(),
+                self.order_size[slots].tolist(),
+                self.order_ts_event[slots].tolist(),
+            )
+        ]
+        for side in (BID, ASK):
+            for idx in np.flatnonzero(self.depths[side] > self.counts[side]).tolist():
+                level = self._price_level(side, idx)
+                orders.append(
+                    Order(0, side_chars[side], level.price, level.size, 0, is_tob=True)
+                )
+        return orders + self.overflow.get_orders()
+
+    def iter_prices(self, side: str) -> Iterator[int]:
+        # prices of the levels of a side, best first
+        px, _, _ = self._side_arrays(side_index[side], self.level_count(side))
+        return iter(px.tolist())
+
+    def get_levels(self, side: int, level_count: int = 1) -> np.ndarray:
+        # tick indices of the best `level_count` non-empty levels of a side in
+        # the window, overflow levels are not included
+        if self.best[side] < 0:
+            return np.empty(0, dtype=np.int64)
+        return self._scan(side, self.best[side], min(level_count, self.n_levels[side]))
+
+    def get_snapshot_arrays(
+        self, level_count: int = 1
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        # (bid_px, bid_sz, bid_ct, ask_px, ask_sz, ask_ct), missing levels are UNDEF_PRICE
+        res = []
+        for side in (BID, ASK):
+            level_px, level_sz, level_ct = self._side_arrays(side, level_count)
+            n = len(level_px)
+            px = np.full(level_count, UNDEF_PRICE, dtype=np.int64)
+            sz = np.zeros(level_count, dtype=np.int64)
+            ct = np.zeros(level_count, dtype=np.int64)
+            px[:n], sz[:n], ct[:n] = level_px, level_sz, level_ct
+            res += [px, sz, ct]
+        return tuple(res)
+
+    def get_snapshot(self, level_count: int = 1) -> list[BidAskPair]:
+        # every field is overwritten, so no reset_snapshot pass
+        while len(self.snapshot) < level_count:
+            self.snapshot.append(BidAskPair())
+        snapshots = self.snapshot[:level_count]
+        columns = [values.tolist() for values in self.get_snapshot_arrays(level_count)]
+        for ba_pair, bid_px, bid_sz, bid_ct, ask_px, ask_sz, ask_ct in zip(
+            snapshots, *columns
+        ):
+            ba_pair.bid_px, ba_pair.bid_sz, ba_pair.bid_ct = bid_px, bid_sz, bid_ct
+            ba_pair.ask_px, ba_pair.ask_sz, ba_pair.ask_ct = ask_px, ask_sz, ask_ct
+        return snapshots
+
+    def apply(
+        self,
+        ts_event: int,
+        action: str,
+        side: str,
+        order_id: int,
+        price: int,
+        size: int,
+        flags: db.RecordFlags,
+    ) -> None:
+        self.overflow.track_touched = self.track_touched
+        # Trade or Fill: no change
+        if action == "T" or action == "F":
+            return
+        # Clear book: remove all resting orders
+        if action == "R":
+            self._clear()
+            self.overflow.apply(ts_event, action, side, order_id, price, size, flags)
+            return
+        # side=N is only valid with Trade, Fill, and Clear actions
+        assert side == "A" or side == "B"
+        # UNDEF_PRICE indicates the book level should be removed
+        if price == UNDEF_PRICE and flags & db.RecordFlags.F_TOB:
+            self._clear_side(side_index[side])
+            self.overflow.apply(ts_event, action, side, order_id, price, size, flags)
+            return
+        # orders outside of the window are in the overflow book
+        if order_id in self.overflow.orders_by_id:
+            self._apply_overflow(ts_event, action, side, order_id, price, size, flags)
+            return
+        # Add: insert a new order
+        if action == "A":
+            self._add(ts_event, side, order_id, price, size, flags)
+        # Cancel: partially or fully cancel some size from a resting order
+        elif action == "C":
+            self._cancel(side, order_id, price, size)
+        # Modify: change the price and/or size of a resting order
+        elif action == "M":
+            self._modify(ts_event, side, order_id, price, size, flags)
+        else:
+            raise ValueError(f"Unknown {action =}")
+
+    def _apply_overflow(
+        self,
+        ts_event: int,
+        action: str,
+        side: str,
+        order_id: int,
+        price: int,
+        size: int,
+        flags: db.RecordFlags,
+    ):
+        if action != "M" or self._tick_index(price) is None:
+            self.overflow.apply(ts_event, action, side, order_id, price, size, flags)
+            return
+        # modified back into the window, unless growing it already moved it
+        order = self.overflow.orders_by_id.get(order_id)
+        if order is not None:
+            self.overflow.apply(
+                ts_event, "C", side, order_id, order.price, order.size, flags
+            )
+        self._modify(ts_event, side, order_id, price, size, flags)
+
+    def _clear(self):
+        self.slots_by_id.clear()
+        self.free_slots.clear()
+        self.n_slots = 0
+        self._clear_side(BID)
+        self._clear_side(ASK)
+
+    def _clear_side(self, side: int):
+        if self.track_touched and self.ref_tick is not None:
+            prices = (
+                self.ref_tick + np.flatnonzero(self.depths[side])
+            ) * self.tick_size
+            self.touched.update((side_chars[side], int(px)) for px in prices)
+        self.n_levels[side] = 0
+        self.sizes[side] = 0
+        self.counts[side] = 0
+        self.depths[side] = 0
+        self.best[side] = -1
+
+    def _add(
+        self,
+        ts_event: int,
+        side: str,
+        order_id: int,
+        price: int,
+        size: int,
+        flags: db.RecordFlags,
+    ):
+        s = side_index[side]
+        idx = self._tick_index(price)
+        if flags & db.RecordFlags.F_TOB:
+            # TOB orders replace the whole side and are not tracked by id
+            self._clear_side(s)
+            if self.overflow.level_count(side):
+                self.overflow.apply(ts_event, "A", side, 0, UNDEF_PRICE, 0, flags)
+            if idx is None:
+                self.overflow.apply(ts_event, "A", side, order_id, price, size, flags)
+            else:
+                self._level_add(s, idx, size, count=0)
+            return
+        if idx is None:
+            self.overflow.apply(ts_event, "A", side, order_id, price, size, flags)
+            return
+        assert order_id not in self.slots_by_id
+        slot = self._alloc_slot()
+        self.slots_by_id[order_id] = slot
+        self.order_price[slot] = price
+        self.order_size[slot] = size
+        self.order_ts_event[slot] = ts_event
+        self.order_side[slot] = s
+        self.order_seq[slot] = self.next_seq
+        self.next_seq += 1
+        self._level_add(s, idx, size, count=1)
+
+    def _cancel(
+        self,
+        side: str,
+        order_id: int,
+        price: int,
+        size: int,
+    ):
+        slot = self.slots_by_id[order_id]
+        s = side_index[side]
+        idx = self._tick_index(self.order_price[slot])
+        if not self.depths[s, idx]:
+            raise KeyError(f"No price level found for {price =} and {side =}")
+        assert self.order_size[slot] >= size
+        self._touch(s, idx)
+        self.order_size[slot] -= size
+        self.sizes[s, idx] -= size
+        # If the full size is cancelled, remove the order from the book
+        if self.order_size[slot] == 0:
+            self.slots_by_id.pop(order_id)
+            self.free_slots.append(slot)
+            self._level_remove(s, idx, count=1)
+
+    def _modify(
+        self,
+        ts_event: int,
+        side: str,
+        order_id: int,
+        price: int,
+        size: int,
+        flags: db.RecordFlags,
+    ):
+        slot = self.slots_by_id.get(order_id)
+        if slot is None:
+            # If order not found, treat it as an add
+            self._add(ts_event, side, order_id, price, size, flags)
+            return
+        s = side_index[side]
+        assert self.order_side[slot] == s, f"Order {order_id} changed side to {side}"
+        # before prev_idx, growing the window shifts the indices
+        idx = self._tick_index(price)
+        prev_price = int(self.order_price[slot])
+        prev_size = int(self.order_size[slot])
+        if idx is None:
+            # moved out of the window
+            self._cancel(side, order_id, prev_price, prev_size)
+            self.overflow.apply(ts_event, "A", side, order_id, price, size, flags)
+            return
+        prev_idx = self._tick_index(prev_price)
+        if prev_price != price:
+            self.sizes[s, prev_idx] -= prev_size
+            self._level_remove(s, prev_idx, count=1)
+            self._level_add(s, idx, size, count=1)
+        else:
+            self._touch(s, prev_idx)
+            self.sizes[s, prev_idx] += size - prev_size
+        # The order loses its priority if the price changes or the size increases
+        if prev_price != price or prev_size < size:
+            self.order_ts_event[slot] = ts_event
+            self.order_seq[slot] = self.next_seq
+            self.next_seq += 1
+        self.order_size[slot] = size
+        self.order_price[slot] = price
+
+    def _level_add(self, side: int, idx: int, size: int, count: int):
+        self._touch(side, idx)
+        self.sizes[side, idx] += size
+        self.counts[side, idx] += count
+        if not self.depths[side, idx]:
+            self.n_levels[side] += 1
+        self.depths[side, idx] += 1
+        best = self.best[side]
+        if best < 0 or (idx > best if side == BID else idx < best):
+            self.best[side] = idx
+
+    def _level_remove(self, side: int, idx: int, count: int):
+        self._touch(side, idx)
+        self.counts[side, idx] -= count
+        self.depths[side, idx] -= 1
+        if self.depths[side, idx]:
+            return
+        self.n_levels[side] -= 1
+        if idx != self.best[side]:
+            return
+        # the best level emptied, search for the next one away from the spread
+        if not self.n_levels[side]:
+            self.best[side] = -1
+            return
+        self.best[side] = int(
+            self._scan(side, idx - 1 if side == BID else idx + 1, 1)[0]
+        )
+
+    def _scan(self, side: int, start: int, level_count: int) -> np.ndarray:
+        # non-empty tick indices from `start` away from the spread. Searches
+        # growing slices so the cost follows the distance to the levels rather
+        # than the window size.
+        depths = self.depths[side]
+        width = max(4 * level_count, 64)
+        while True:
+            if side == BID:
+                lo = max(start + 1 - width, 0)
+                idx = lo + np.flatnonzero(depths[lo : start + 1])[::-1]
+                done = lo == 0
+            else:
+                hi = min(start + width, self.n_ticks)
+                idx = start + np.flatnonzero(depths[start:hi])
+                done = hi == self.n_ticks
+            if len(idx) >= level_count or done:
+                return idx[:level_count]
+            width *= 4
+
+    def _touch(self, side: int, idx: int):
+        if self.track_touched:
+            price = (self.ref_tick + idx) * self.tick_size
+            self.touched.add((side_chars[side], price))
+
+    def _nth_level(self, side: int, idx: int) -> PriceLevel | None:
+        if not self.overflow.level_count(side_chars[side]):
+            levels = self.get_levels(side, idx + 1)
+            if len(levels) > idx:
+                return self._price_level(side, int(levels[idx]))
+            return None
+        px, sz, ct = self._side_arrays(side, idx + 1)
+        if len(px) > idx:
+            return PriceLevel(price=int(px[idx]), size=int(sz[idx]), count=int(ct[idx]))
+        return None
+
+    def _side_arrays(
+        self, side: int, level_count: int
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # price, size and count of the best `level_count` levels of a side,
+        # window and overflow merged
+        if self.ref_tick is None:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, empty
+        idx = self.get_levels(side, level_count)
+        px = (self.ref_tick + idx) * self.tick_size
+        sz, ct = self.sizes[side, idx], self.counts[side, idx]
+        n_far = min(self.overflow.level_count(side_chars[side]), level_count)
+        if not n_far:
+            return px, sz, ct
+        get_level = (
+            self.overflow.get_bid_level if side == BID else self.overflow.get_ask_level
+        )
+        far = [get_level(i) for i in range(n_far)]
+        px = np.concatenate([px, [level.price for level in far]]).astype(np.int64)
+        sz = np.concatenate([sz, [level.size for level in far]]).astype(np.int64)
+        ct = np.concatenate([ct, [level.count for level in far]]).astype(np.int64)
+        order = np.argsort(-px if side == BID else px)[:level_count]
+        return px[order], sz[order], ct[order]
+
+    def _level_by_px(self, side: int, px: int) -> PriceLevel | None:
+        if self.ref_tick is None or px % self.tick_size:
+            return None
+        idx = px // self.tick_size - self.ref_tick
+        if 0 <= idx < self.n_ticks and self.depths[side, idx]:
+            return self._price_level(side, idx)
+        if side == BID:
+            return self.overflow.get_bid_level_by_px(px)
+        return self.overflow.get_ask_level_by_px(px)
+
+    def _price_level(self, side: int, idx: int) -> PriceLevel:
+        return PriceLevel(
+            price=(self.ref_tick + idx) * self.tick_size,
+            size=int(self.sizes[side, idx]),
+            count=int(self.counts[side, idx]),
+        )
+
+    def _tick_index(self, price: int) -> int | None:
+        # None if the price is too far away for the window
+        tick, rem = divmod(int(price), self.tick_size)
+        if rem:
+            raise ValueError(f"{price =} is not a multiple of {self.tick_size =}")
+        if self.ref_tick is None:
+            self.ref_tick = tick - self.n_ticks // 2
+        idx = tick - self.ref_tick
+        if idx < 0 or idx >= self.n_ticks:
+            if not self._grow(idx):
+                return None
+            idx = tick - self.ref_tick
+        return idx
+
+    def _grow(self, idx: int) -> bool:
+        # double the window until `idx` fits, padding on the side it fell out
+        # of, False if that takes more than max_ticks
+        needed = -idx if idx < 0 else idx + 1 - self.n_ticks
+        n_ticks = self.n_ticks
+        while n_ticks - self.n_ticks < needed:
+            n_ticks *= 2
+        if n_ticks > self.max_ticks:
+            return False
+        shift = n_ticks - self.n_ticks if idx < 0 else 0
+        for name in ("sizes", "counts", "depths"):
+            old = getattr(self, name)
+            new = np.zeros((2, n_ticks), dtype=old.dtype)
+            new[:, shift : shift + self.n_ticks] = old
+            setattr(self, name, new)
+        self.best = [b + shift if b >= 0 else b for b in self.best]
+        self.ref_tick -= shift
+        self.n_ticks = n_ticks
+        self._move_overflow()
+        return True
+
+    def _move_overflow(self):
+        # overflow orders the grown window now covers move into it, so a price
+        # is never in both
+        for order in self.overflow.get_orders():
+            idx = order.price // self.tick_size - self.ref_tick
+            if not 0 <= idx < self.n_ticks:
+                continue
+            if order.is_tob:
+                flags = db.RecordFlags.F_TOB
+                self.overflow.apply(0, "A", order.side, 0, UNDEF_PRICE, 0, flags)
+            else:
+                flags = db.RecordFlags(0)
+                self.overflow.apply(
+                    0, "C", order.side, order.id, order.price, order.size, flags
+                )
+            self._add(
+                order.ts_event, order.side, order.id, order.price, order.size, flags
+            )
+
+    def _alloc_slot(self) -> int:
+        if self.free_slots:
+            return self.free_slots.pop()
+        if self.n_slots == len(self.order_price):
+            for name in (
+                "order_price",
+                "order_size",
+                "order_ts_event",
+                "order_side",
+                "order_seq",
+            ):
+                old = getattr(self, name)
+                setattr(self, name, np.concatenate([old, np.zeros_like(old)]))
+        self.n_slots += 1
+        return self.n_slots - 1
+
+
 @dataclass
 class Market:
-    books: defaultdict[int, defaultdict[int, Book]] = field(
-        default_factory=lambda: defaultdict(lambda: defaultdict(Book)),
-    )
+    books: defaultdict[int, defaultdict[int, Book]] | None = None
+    book_factory: Callable[[], Book | ArrayBook] = Book
+
+    def __post_init__(self):
+        if self.books is None:
+            self.books = defaultdict(lambda: defaultdict(self.book_factory))
 
     def get_books_by_pub(self, instrument_id: int) -> defaultdict[int, Book]:
         return self.books[instrument_id]
@@ -302,6 +922,349 @@ class Market:
         )
 
 
+@dataclass
+class IncrementalDepth:
+    # Turns the levels touched in a book into sierra depth commands for the
+    # top `snapshot_size` levels per side, instead of diffing full snapshots.
+    # `sent` mirrors what the depth file currently shows: price -> (count, size)
+    book: Book | ArrayBook
+    snapshot_size: int = 100
+    sent: dict[str, SortedDict] = field(
+        default_factory=lambda: {"B": SortedDict(), "A": SortedDict()}
+    )
+    started: bool = False
+
+    def __post_init__(self):
+        self.book.track_touched = True
+
+    # (command, flag, orders, price, quantity), prices stay fixed point
+    def emit(self) -> list[tuple[int, int, int, int, int]]:
+        book = self.book
+        touched, book.touched = book.touched, set()
+        flag = int(self.started)
+        deletes, updates = [], []
+        if not self.started:
+            self.started = True
+            deletes.append((bento_to_sierra_command_mapping["R"], 0, 0, 0, 0))
+        bounds = {side: self._window_bound(side) for side in "BA"}
+        for side, price in touched:
+            sent = self.sent[side]
+            level = self._level_by_px(side, price)
+            if level is not None and self._in_window(side, price, bounds[side]):
+                value = (level.count, level.size)
+                if price not in sent:
+                    updates.append(self._command("A", side, flag, price, value))
+                elif sent[price] != value:
+                    updates.append(self._command("M", side, flag, price, value))
+                sent[price] = value
+            elif price in sent:
+                deletes.append(self._command("C", side, flag, price, (0, 0)))
+                del sent[price]
+        for side in "BA":
+            sent, bound = self.sent[side], bounds[side]
+            # untouched levels pushed out of the window by better ones
+            if bound is not None:
+                worst = 0 if side == "B" else -1
+                while sent and not self._in_window(
+                    side, sent.peekitem(worst)[0], bound
+                ):
+                    price, _ = sent.popitem(worst)
+                    deletes.append(self._command("C", side, flag, price, (0, 0)))
+            # untouched levels pulled into the window by removed ones, a side
+            # with a bound has at least snapshot_size levels
+            if bound is None:
+                n_levels = book.level_count(side)
+            else:
+                n_levels = self.snapshot_size
+            if len(sent) >= n_levels:
+                continue
+            for price in islice(book.iter_prices(side), self.snapshot_size):
+                if price not in sent:
+                    level = self._level_by_px(side, price)
+                    value = (level.count, level.size)
+                    updates.append(self._command("A", side, flag, price, value))
+                    sent[price] = value
+        deletes.sort(key=lambda c: c[3])
+        updates.sort(key=lambda c: c[3])
+        return deletes + updates
+
+    # emit() as depth_rec_dtype tuples stamped with a sierra timestamp
+    def emit_records(self, timestamp: int) -> list[tuple]:
+        return [
+            (timestamp, command, flag, orders, price / FIXED_PRICE_SCALE, quantity, 0)
+            for command, flag, orders, price, quantity in self.emit()
+        ]
+
+    def _command(self, action, side, flag, price, value):
+        count, size = value
+        return (
+            bento_to_sierra_command_mapping[f"{action}{side}"],
+            flag,
+            count,
+            price,
+            size,
+        )
+
+    def _level_by_px(self, side: str, price: int) -> PriceLevel | None:
+        if side == "B":
+            return self.book.get_bid_level_by_px(price)
+        return self.book.get_ask_level_by_px(price)
+
+    def _window_bound(self, side: str) -> int | None:
+        # price of the last level inside the window, None if the side is shorter
+        if side == "B":
+            level = self.book.get_bid_level(self.snapshot_size - 1)
+        else:
+            level = self.book.get_ask_level(self.snapshot_size - 1)
+        return level.price if level is not None else None
+
+    def _in_window(self, side: str, price: int, bound: int | None) -> bool:
+        if bound is None:
+            return True
+        return price >= bound if side == "B" else price <= bound
+
+
+class AggregatedBook:
+    # Read only view of the publisher books of one instrument, levels at the
+    # same price are summed like Market.aggregated_bbo does for the top of
+    # book. Has the parts of the Book API that IncrementalDepth needs and only
+    # uses the public API of the books, so they can be Books or ArrayBooks.
+    def __init__(self, books: dict[int, Book | ArrayBook]):
+        self.books = books
+
+    @property
+    def track_touched(self) -> bool:
+        return all(book.track_touched for book in self.books.values())
+
+    @track_touched.setter
+    def track_touched(self, value: bool):
+        for book in self.books.values():
+            book.track_touched = value
+
+    @property
+    def touched(self) -> set[tuple[str, int]]:
+        return set().union(*(book.touched for book in self.books.values()))
+
+    @touched.setter
+    def touched(self, value: set[tuple[str, int]]):
+        for book in self.books.values():
+            book.touched = set(value)
+
+    def level_count(self, side: str) -> int:
+        if len(self.books) == 1:
+            return next(iter(self.books.values())).level_count(side)
+        return len(set().union(*(b.iter_prices(side) for b in self.books.values())))
+
+    def get_bid_level(self, idx: int = 0) -> PriceLevel | None:
+        return self._nth_level("B", idx)
+
+    def get_ask_level(self, idx: int = 0) -> PriceLevel | None:
+        return self._nth_level("A", idx)
+
+    def get_bid_level_by_px(self, px: int) -> PriceLevel | None:
+        return self._sum_levels(
+            [b.get_bid_level_by_px(px) for b in self.books.values()]
+        )
+
+    def get_ask_level_by_px(self, px: int) -> PriceLevel | None:
+        return self._sum_levels(
+            [b.get_ask_level_by_px(px) for b in self.books.values()]
+        )
+
+    def iter_prices(self, side: str) -> Iterator[int]:
+        # prices of all books merged lazily, best first, so taking N levels is
+        # a single pass. The same price in several books is one level.
+        prices = heapq.merge(
+            *(book.iter_prices(side) for book in self.books.values()),
+            reverse=side == "B",
+        )
+        return (price for price, _ in groupby(prices))
+
+    def _nth_level(self, side: str, idx: int) -> PriceLevel | None:
+        price = next(islice(self.iter_prices(side), idx, None), None)
+        if price is None:
+            return None
+        if side == "B":
+            return self.get_bid_level_by_px(price)
+        return self.get_ask_level_by_px(price)
+
+    def _sum_levels(self, levels: list[PriceLevel | None]) -> PriceLevel | None:
+        levels = [level for level in levels if level is not None]
+        if not levels:
+            return None
+        return PriceLevel(
+            price=levels[0].price,
+            size=sum(level.size for level in levels),
+            count=sum(level.count for level in levels),
+        )
+
+
+# Market checkpoint files, also read by bento-cpp (book.hpp CheckpointFile):
+# header | checkpoint blocks | index | footer. A block is the block header
+# followed by, per book, the book header and its orders in queue order.
+checkpoint_magic = b"PHCK"
+checkpoint_version = 1
+checkpoint_header_fmt = "<4sI"  # magic, version
+checkpoint_block_fmt = "<QQII"  # ts_event, n_records, sequence, n_books
+checkpoint_book_fmt = "<IHHQ"  # instrument_id, publisher_id, reserved, n_orders
+checkpoint_footer_fmt = "<QQ4sI"  # index offset, n_checkpoints, magic, reserved
+checkpoint_order_dtype = np.dtype(
+    [
+        ("order_id", "<u8"),
+        ("ts_event", "<u8"),
+        ("price", "<i8"),
+        ("size", "<u4"),
+        ("side", "S1"),
+        ("is_tob", "u1"),
+        ("reserved", "<u2"),
+    ]
+)
+checkpoint_index_dtype = np.dtype(
+    [
+        ("ts_event", "<u8"),
+        ("n_records", "<u8"),
+        ("sequence", "<u4"),
+        ("reserved", "<u4"),
+        ("offset", "<u8"),
+    ]
+)
+
+
+class CheckpointWriter:
+    # Saves the state of a Market during a replay. update() takes a checkpoint
+    # at the first F_LAST record once `every_events` records or `every_ns` of
+    # ts_event have passed since the previous one, close() writes the index.
+    # The books can be Books or ArrayBooks, both have get_orders().
+    def __init__(self, path, every_events=1_000_000, every_ns=None):
+        self.path = path
+        self.every_events = every_events
+        self.every_ns = every_ns
+        self.index = []
+        self.last_n_records = 0
+        self.last_ts_event = None
+        self.file = open(path, "wb")
+        self.file.write(
+            struct.pack(checkpoint_header_fmt, checkpoint_magic, checkpoint_version)
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def update(self, market: Market, mbo: db.MBOMsg, n_records: int):
+        # `n_records` is the number of records replayed so far, mbo included
+        if self.last_ts_event is None:
+            self.last_ts_event = mbo.ts_event
+        if not mbo.flags & db.RecordFlags.F_LAST:
+            return
+        due_events = (
+            self.every_events and n_records - self.last_n_records >= self.every_events
+        )
+        due_ns = self.every_ns and mbo.ts_event - self.last_ts_event >= self.every_ns
+        if due_events or due_ns:
+            self.write(market, mbo.ts_event, mbo.sequence, n_records)
+
+    def write(self, market: Market, ts_event: int, sequence: int, n_records: int):
+        offset = self.file.tell()
+        books = [
+            (instrument_id, publisher_id, book)
+            for instrument_id, books_by_pub in market.books.items()
+            for publisher_id, book in books_by_pub.items()
+        ]
+        self.file.write(
+            struct.pack(checkpoint_block_fmt, ts_event, n_records, sequence, len(books))
+        )
+        for instrument_id, publisher_id, book in books:
+            orders = np.array(
+                [
+                    (o.id, o.ts_event, o.price, o.size, str(o.side), o.is_tob, 0)
+                    for o in book.get_orders()
+                ],
+                dtype=checkpoint_order_dtype,
+            )
+            self.file.write(
+                struct.pack(
+                    checkpoint_book_fmt, instrument_id, publisher_id, 0, len(orders)
+                )
+            )
+            orders.tofile(self.file)
+        self.index.append((ts_event, n_records, sequence, 0, offset))
+        self.last_n_records, self.last_ts_event = n_records, ts_event
+
+    def close(self):
+        if self.file.closed:
+            return
+        index_offset = self.file.tell()
+        np.array(self.index, dtype=checkpoint_index_dtype).tofile(self.file)
+        self.file.write(
+            struct.pack(
+                checkpoint_footer_fmt,
+                index_offset,
+                len(self.index),
+                checkpoint_magic,
+                0,
+            )
+        )
+        self.file.close()
+
+
+class CheckpointFile:
+    def __init__(self, path):
+        self.path = path
+        header_len = calcsize(checkpoint_header_fmt)
+        footer_len = calcsize(checkpoint_footer_fmt)
+        with open(path, "rb") as f:
+            magic, version = struct.unpack(checkpoint_header_fmt, f.read(header_len))
+            if magic != checkpoint_magic or version != checkpoint_version:
+                raise ValueError(
+                    f"{path} is not a version {checkpoint_version} checkpoint file"
+                )
+            f.seek(-footer_len, os.SEEK_END)
+            index_offset, n_checkpoints, magic, _ = struct.unpack(
+                checkpoint_footer_fmt, f.read(footer_len)
+            )
+            if magic != checkpoint_magic:
+                raise ValueError(f"{path} has no index, the writer was not closed")
+            f.seek(index_offset)
+            self.index = np.fromfile(
+                f, dtype=checkpoint_index_dtype, count=n_checkpoints
+            )
+
+    def __len__(self):
+        return len(self.index)
+
+    def nearest(self, ts_event: int) -> int | None:
+        # position of the last checkpoint taken at or before ts_event
+        pos = np.searchsorted(self.index["ts_event"], ts_event, "right") - 1
+        return int(pos) if pos >= 0 else None
+
+    def load(
+        self, pos: int, book_factory: Callable[[], Book | ArrayBook] = Book
+    ) -> Market:
+        # the orders are added back in queue order, which restores priority too
+        market = Market(book_factory=book_factory)
+        block_len = calcsize(checkpoint_block_fmt)
+        book_len = calcsize(checkpoint_book_fmt)
+        with open(self.path, "rb") as f:
+            f.seek(int(self.index["offset"][pos]))
+            *_, n_books = struct.unpack(checkpoint_block_fmt, f.read(block_len))
+            for _ in range(n_books):
+                instrument_id, publisher_id, _, n_orders = struct.unpack(
+                    checkpoint_book_fmt, f.read(book_len)
+                )
+                orders = np.fromfile(f, dtype=checkpoint_order_dtype, count=n_orders)
+                book = market.get_book(instrument_id, publisher_id)
+                for o in orders.tolist():
+                    order_id, ts_event, price, size, side, is_tob, _ = o
+                    flags = db.RecordFlags.F_TOB if is_tob else db.RecordFlags(0)
+                    book.apply(
+                        ts_event, "A", side.decode(), order_id, price, size, flags
+                    )
+        return market
+
+
 class intraday_rec(IntEnum):
     timestamp = 0
     open = 1
@@ -344,27 +1307,89 @@ intraday_rec_fmt = "q4f4I"
 intraday_rec_len = calcsize(intraday_rec_fmt)
 intraday_rec_unpack = Struct(intraday_rec_fmt).unpack_from
 
+# structured dtype with the same layout as `intraday_rec_fmt`
+intraday_rec_dtype = np.dtype(
+    [
+        ("timestamp", "<i8"),
+        ("open", "<f4"),
+        ("high", "<f4"),
+        ("low", "<f4"),
+        ("close", "<f4"),
+        ("num_trades", "<u4"),
+        ("total_vol", "<u4"),
+        ("bid_vol", "<u4"),
+        ("ask_vol", "<u4"),
+    ]
+)
+
+depth_header_fmt = "4I48s"
+depth_header_len = calcsize(depth_header_fmt)
+
+depth_rec_fmt = "qbbhfII"
+depth_rec_len = calcsize(depth_rec_fmt)
+
+# structured dtype with the same layout as `depth_rec_fmt`
+depth_rec_dtype = np.dtype(
+    [
+        ("timestamp", "<i8"),
+        ("command", "i1"),
+        ("flag", "i1"),
+        ("orders", "<i2"),
+        ("price", "<f4"),
+        ("quantity", "<u4"),
+        ("reserved", "<u4"),
+    ]
+)
 
-def convert_sierra_timestamp_to_datetime(ts):
-    return (
-        (sierra_global_epoch + timedelta64(ts, "us"))
-        .astype(datetime)
-        .strftime("%Y-%m-%d %H:%M:%S.%f")
+scid_header = b"SCID8\x00\x00\x00(\x00\x00\x00\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00"
+depth_header = b"SCDD@\x00\x00\x00\x18\x00\x00\x00\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00"
+
+# microseconds between the sierra epoch and the unix epoch
+sierra_epoch_offset_us = int(
+    (datetime64("1970-01-01", "us") - sierra_global_epoch) // timedelta64(1, "us")
+)
+
+
+# Conversions between unix ns, datetime64 and sierra us timestamps. They take
+# scalars or whole arrays/columns and only use int64 arithmetic, sub us parts
+# are floored. Naive datetimes are UTC.
+def unix_ns_to_sierra(ns, resolution_us=1):
+    # `resolution_us=1000` floors to the ms resolution of .depth files
+    res = np.asarray(ns, dtype=np.int64) // 1000 + sierra_epoch_offset_us
+    if resolution_us != 1:
+        res = res // resolution_us * resolution_us
+    return res if res.ndim else int(res)
+
+
+def sierra_to_unix_ns(ts):
+    res = (np.asarray(ts, dtype=np.int64) - sierra_epoch_offset_us) * 1000
+    return res if res.ndim else int(res)
+
+
+def datetime64_to_sierra(dt, resolution_us=1):
+    ns = np.asarray(dt, dtype="datetime64[ns]").astype(np.int64)
+    return unix_ns_to_sierra(ns, resolution_us)
+
+
+def sierra_to_datetime64(ts):
+    return (np.asarray(ts, dtype=np.int64) - sierra_epoch_offset_us).astype(
+        "datetime64[us]"
     )
 
 
+def unix_nanos(value) -> int:
+    # ints are taken as unix ns already, anything else goes through pandas
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    return pd.Timestamp(value).value
+
+
+def convert_sierra_timestamp_to_datetime(ts):
+    return sierra_to_datetime64(ts).astype(datetime).strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
 def convert_to_sierra_timestamp(timestamp_str):
-    sierra_epoch = sierra_global_epoch.tolist()
-    sierra_epoch = datetime(
-        sierra_epoch.year, sierra_epoch.month, sierra_epoch.day, tzinfo=timezone.utc
-    )
-    dt = datetime.fromisoformat(timestamp_str)
-    # If dt is offset-naive, make it UTC aware
-    if dt.tzinfo is None:
-        dt = dt.replace(tzinfo=timezone.utc)
-    time_diff = dt - sierra_epoch  # Both are now UTC aware
-    microseconds = time_diff.total_seconds() * 1e6
-    return int(microseconds)
+    return unix_ns_to_sierra(unix_nanos(timestamp_str))
 
 
 def get_header_bytes(fd):
@@ -378,37 +1403,240 @@ def parse_tas_header(fd):
     return header
 
 
+def to_sierra_timestamp(value):
+    # ints are taken as sierra timestamps already, anything else goes through pandas
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    return unix_ns_to_sierra(unix_nanos(value))
+
+
+class SierraFile:
+    # Zero-copy view of a sierra record file: the records past the header are
+    # memory mapped as `dtype`, slicing by time only touches the pages visited
+    # by the binary search.
+    magic: bytes
+    header_len: int
+    dtype: np.dtype
+    hidden_fields: tuple[str, ...] = ()
+
+    def __init__(self, path, records=None):
+        self.path = path
+        self.records = self._map(path) if records is None else records
+
+    @classmethod
+    def _map(cls, path):
+        with open(path, "rb") as f:
+            header = f.read(cls.header_len)
+        magic, header_len, rec_len = struct.unpack_from("4sII", header)
+        if magic != cls.magic or rec_len != cls.dtype.itemsize:
+            raise ValueError(f"{path} is not a valid {cls.magic.decode()} file")
+        if os.path.getsize(path) <= header_len:
+            return np.empty(0, dtype=cls.dtype)
+        return np.memmap(path, dtype=cls.dtype, mode="r", offset=header_len)
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def timestamps(self):
+        return self.records["timestamp"]
+
+    def between(self, start=None, end=None):
+        # half-open [start, end) range, bounds are sierra timestamps or datetimes
+        lo, hi = 0, len(self.records)
+        if start is not None:
+            lo = np.searchsorted(self.timestamps, to_sierra_timestamp(start), "left")
+        if end is not None:
+            hi = np.searchsorted(self.timestamps, to_sierra_timestamp(end), "left")
+        return type(self)(self.path, self.records[lo : max(lo, hi)])
+
+    def iter_chunks(self, chunk_size=1_000_000):
+        # bounded memory iteration for files larger than RAM
+        for i in range(0, len(self.records), chunk_size):
+            yield type(self)(self.path, self.records[i : i + chunk_size])
+
+    def to_df(self):
+        res = pd.DataFrame(np.asarray(self.records))
+        res = res.drop(columns=list(self.hidden_fields))
+        res["ts"] = sierra_to_datetime64(res.timestamp.values)
+        return res
+
+
+class ScidFile(SierraFile):
+    magic = b"SCID"
+    header_len = intraday_header_len
+    dtype = intraday_rec_dtype
+
+
+class DepthFile(SierraFile):
+    magic = b"SCDD"
+    header_len = depth_header_len
+    dtype = depth_rec_dtype
+    hidden_fields = ("reserved",)
+
+
+class SierraWriter:
+    # Streams record batches to a sierra file. A batch is either an array of
+    # `dtype` or a DataFrame with (at least) its non-hidden fields as columns,
+    # each batch is converted in one step and written with a single tofile.
+    # With `append=True` an existing file is extended in place; records which
+    # are not newer than its last record are dropped (`on_overlap="drop"`) or
+    # rejected with a ValueError (`on_overlap="raise"`).
+    header: bytes
+    dtype: np.dtype
+    hidden_fields: tuple[str, ...] = ()
+
+    def __init__(self, target_path, append=False, on_overlap="drop"):
+        if on_overlap not in ("drop", "raise"):
+            raise ValueError(f"Invalid {on_overlap =}")
+        self.path = target_path
+        self.on_overlap = on_overlap
+        self.n_records = 0
+        self.n_dropped = 0
+        self.last_timestamp = None
+        if append and os.path.exists(target_path):
+            self.last_timestamp = self._read_last_timestamp()
+            self.file = open(target_path, "ab")
+        else:
+            self.file = open(target_path, "wb")
+            self.file.write(self.header)
+
+    def _read_last_timestamp(self):
+        # only the header and the last record are read from the existing file
+        header_len = len(self.header)
+        size = os.path.getsize(self.path)
+        with open(self.path, "rb") as f:
+            header = f.read(header_len)
+            if header[:12] != self.header[:12]:
+                raise ValueError(f"unexpected header in {self.path} -> {header[:12]}")
+            if (size - header_len) % self.dtype.itemsize:
+                raise ValueError(f"{self.path} ends with a partial record")
+            if size == header_len:
+                return None
+            f.seek(-self.dtype.itemsize, os.SEEK_END)
+            last = np.frombuffer(f.read(self.dtype.itemsize), dtype=self.dtype)
+        return int(last["timestamp"][0])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.file.close()
+
+    def to_records(self, batch):
+        if isinstance(batch, np.ndarray) and batch.dtype == self.dtype:
+            return batch
+        recs = np.zeros(len(batch), dtype=self.dtype)
+        for name in self.dtype.names:
+            if name not in self.hidden_fields:
+                recs[name] = np.asarray(batch[name])
+        return recs
+
+    def write(self, batch):
+        recs = self.to_records(batch)
+        if self.last_timestamp is not None:
+            newer = recs["timestamp"] > self.last_timestamp
+            if not newer.all():
+                if self.on_overlap == "raise":
+                    raise ValueError(
+                        f"{(~newer).sum()} records overlap with {self.path}, "
+                        f"last timestamp -> {self.last_timestamp}"
+                    )
+                self.n_dropped += len(recs) - newer.sum()
+                recs = recs[newer]
+        recs.tofile(self.file)
+        self.n_records += len(recs)
+
+    def write_all(self, data, chunk_size=1_000_000):
+        # `data` is a single batch (split into chunks) or an iterable of batches
+        if isinstance(data, pd.DataFrame):
+            batches = (
+                data.iloc[i : i + chunk_size] for i in range(0, len(data), chunk_size)
+            )
+        elif isinstance(data, np.ndarray):
+            batches = (
+                data[i : i + chunk_size] for i in range(0, len(data), chunk_size)
+            )
+        else:
+            batches = data
+        for batch in batches:
+            self.write(batch)
+
+
+class ScidWriter(SierraWriter):
+    header = scid_header
+    dtype = intraday_rec_dtype
+
+
+class DepthWriter(SierraWriter):
+    header = depth_header
+    dtype = depth_rec_dtype
+    hidden_fields = ("reserved",)
+
+
+def write_depth_file(
+    depth, target_path, chunk_size=1_000_000, append=False, on_overlap="drop"
+):
+    print("write bytes to", target_path)
+    with DepthWriter(target_path, append, on_overlap) as writer:
+        writer.write_all(depth, chunk_size)
+    print(f"done, {writer.n_records} records ({writer.n_dropped} overlapping dropped).")
+
+
 def parse_market_depth_file(filepath):
-    rows = []
-    with open(filepath, "rb") as input_file:
-        header = input_file.read(64)
-        print(header)
-        header = struct.unpack("4I48s", header)
-        while True:
-            current = {}
-            tick = input_file.read(24)
-            if not tick:
-                break
-            src = struct.unpack("qbbhfII", tick)
-            current["timestamp"] = src[0]
-            current["command"] = src[1]
-            current["flag"] = src[2]
-            current["orders"] = src[3]
-            current["price"] = src[4]
-            current["quantity"] = src[5]
-            rows.append(current)
-    return rows
-
-
-def get_market_depth_df_from_depth_file(filepath):
+    return DepthFile(filepath).records
+
+
+def get_market_depth_df_from_depth_file(filepath, start=None, end=None):
     print(f"make_market_depth_df_from_filepath -> {filepath}")
-    rows = parse_market_depth_file(filepath)
-    res = pd.DataFrame(rows)
-    res["ts"] = res.timestamp.apply(convert_sierra_timestamp_to_datetime)
-    return res
+    return DepthFile(filepath).between(start, end).to_df()
+
 
+def mbo_to_scid_records(mbo):
+    # `mbo` is a DBN MBO record array (DBNStore.to_ndarray), only fills are kept
+    fills = mbo[mbo["action"] == b"F"]
+    recs = np.zeros(len(fills), dtype=intraday_rec_dtype)
+    recs["timestamp"] = unix_ns_to_sierra(fills["ts_event"])
+    price = np.where(
+        fills["price"] == UNDEF_PRICE, np.nan, fills["price"].astype(np.float64)
+    )
+    price = price / FIXED_PRICE_SCALE
+    recs["high"] = price
+    recs["low"] = price
+    recs["close"] = price
+    recs["num_trades"] = 1
+    recs["total_vol"] = fills["size"]
+    recs["bid_vol"] = np.where(fills["side"] == b"B", fills["size"], 0)
+    recs["ask_vol"] = np.where(fills["side"] == b"A", fills["size"], 0)
+    return recs
+
+
+def write_scid_file(
+    recs, target_path, chunk_size=1_000_000, append=False, on_overlap="drop"
+):
+    print("write bytes to", target_path)
+    with ScidWriter(target_path, append, on_overlap) as writer:
+        writer.write_all(recs, chunk_size)
+    print("done.")
 
-def bento_to_scid(bento_zst_path, target_path):
+
+def bento_to_scid(bento_zst_path, target_path, append=False, batch_size=1_000_000):
+    # the records are decoded `batch_size` at a time and only the fills of each
+    # batch are kept, so memory is bounded by the batch instead of the file
+    print("load file")
+    if os.path.exists(bento_zst_path):
+        data = db.DBNStore.from_file(bento_zst_path)
+    else:
+        raise ValueError(f"data file {bento_zst_path} not found.")
+    print("make scid")
+    batches = (mbo_to_scid_records(mbo) for mbo in data.to_ndarray(count=batch_size))
+    write_scid_file(batches, target_path, append=append)
+
+
+def bento_to_scid_slow(bento_zst_path, target_path):
     print("load file")
     if os.path.exists(bento_zst_path):
         data = db.DBNStore.from_file(bento_zst_path)
@@ -420,25 +1648,346 @@ def bento_to_scid(bento_zst_path, target_path):
     ticks_to_scid(primary_to_ticks(bento_to_primary(bento)), target_path)
 
 
-def bento_to_depth(input_filepath, output_filepath, snapshot_size=100, n_states=-1):
-    print("start bento to depth")
-    if os.path.exists(input_filepath):
-        data = db.DBNStore.from_file(input_filepath)
+def aggregate_bars(ticks, bar_ids, timestamps=None):
+    # Sums consecutive intraday records with the same bar id into one bar.
+    # `ticks` is sorted by time, tick records (open == 0) or bars. A bar is
+    # stamped with `timestamps[bar_id]`-like values given per record, by
+    # default the time of its first record.
+    if not len(ticks):
+        return np.zeros(0, dtype=intraday_rec_dtype)
+    starts = np.flatnonzero(np.r_[True, bar_ids[1:] != bar_ids[:-1]])
+    ends = np.r_[starts[1:], len(ticks)] - 1
+    bars = np.zeros(len(starts), dtype=intraday_rec_dtype)
+    bars["timestamp"] = (
+        ticks["timestamp"][starts] if timestamps is None else timestamps[starts]
+    )
+    # a tick record only has the trade price, open is 0
+    opens = np.where(ticks["open"] != 0, ticks["open"], ticks["close"])
+    bars["open"] = opens[starts]
+    bars["high"] = np.maximum.reduceat(ticks["high"], starts)
+    bars["low"] = np.minimum.reduceat(ticks["low"], starts)
+    bars["close"] = ticks["close"][ends]
+    for name in ("num_trades", "total_vol", "bid_vol", "ask_vol"):
+        bars[name] = np.add.reduceat(ticks[name].astype(np.uint64), starts)
+    return bars
+
+
+def time_bars(ticks, seconds):
+    # bars are stamped with their start, aligned to the sierra epoch (midnight)
+    interval_us = int(seconds * 1_000_000)
+    starts = ticks["timestamp"] // interval_us * interval_us
+    return aggregate_bars(ticks, starts, starts)
+
+
+def trade_bars(ticks, n_trades):
+    trades = np.cumsum(ticks["num_trades"], dtype=np.int64)
+    return aggregate_bars(ticks, (trades - ticks["num_trades"]) // n_trades)
+
+
+def volume_bars(ticks, volume):
+    # a record is not split, it belongs to the bar its first contract falls in
+    total = np.cumsum(ticks["total_vol"], dtype=np.int64)
+    return aggregate_bars(ticks, (total - ticks["total_vol"]) // volume)
+
+
+def range_bar_ids(high, low, range_size):
+    # A new bar starts at the record that would make high - low exceed
+    # `range_size`. Path dependent, so the records are scanned from each bar
+    # start with running max/min over a window sized after the previous bar,
+    # doubled until the bar ends inside it.
+    high = high.astype(np.float64)
+    low = low.astype(np.float64)
+    # float32 prices are only exact to a few ulps
+    tolerance = 4 * np.finfo(np.float32).eps * max(np.abs(high).max(), 1.0)
+    bar_ids = np.empty(len(high), dtype=np.int64)
+    start, bar_id, size = 0, 0, 64
+    while start < len(high):
+        while True:
+            end = min(start + size, len(high))
+            spread = np.maximum.accumulate(high[start:end]) - np.minimum.accumulate(
+                low[start:end]
+            )
+            over = np.flatnonzero(spread > range_size + tolerance)
+            if len(over) or end == len(high):
+                break
+            size *= 2
+        # the first record always stays in the bar, even if it is wider alone
+        stop = start + max(int(over[0]), 1) if len(over) else end
+        bar_ids[start:stop] = bar_id
+        size = max(2 * (stop - start), 64)
+        start, bar_id = stop, bar_id + 1
+    return bar_ids
+
+
+def range_bars(ticks, range_size):
+    return aggregate_bars(ticks, range_bar_ids(ticks["high"], ticks["low"], range_size))
+
+
+bar_makers = {
+    "time": time_bars,
+    "trades": trade_bars,
+    "volume": volume_bars,
+    "range": range_bars,
+}
+
+
+def make_bars(ticks, kind, size):
+    # kind: time (size in seconds), trades, volume or range (size in price)
+    if kind not in bar_makers:
+        raise ValueError(f"Invalid {kind =}, expected one of {list(bar_makers)}")
+    return bar_makers[kind](ticks, size)
+
+
+def scid_to_bars(scid_path, target_path, kind, size):
+    # bar .scid file from a tick (or finer bar) .scid file
+    bars = make_bars(np.asarray(ScidFile(scid_path).records), kind, size)
+    write_scid_file(bars, target_path)
+    return bars
+
+
+def bento_to_bars(bento_zst_path, target_path, kind, size, batch_size=1_000_000):
+    # bar .scid file straight from the MBO fills, only the fills are kept
+    # in memory
+    if os.path.exists(bento_zst_path):
+        data = db.DBNStore.from_file(bento_zst_path)
     else:
+        raise ValueError(f"data file {bento_zst_path} not found.")
+    ticks = np.concatenate(
+        [mbo_to_scid_records(mbo) for mbo in data.to_ndarray(count=batch_size)]
+        or [np.zeros(0, dtype=intraday_rec_dtype)]
+    )
+    bars = make_bars(ticks, kind, size)
+    write_scid_file(bars, target_path)
+    return bars
+
+
+def bento_to_depth(
+    input_filepath,
+    output_filepath,
+    snapshot_size=100,
+    n_states=-1,
+    append=False,
+    incremental=True,
+):
+    # bento-to-depth (see bento-cpp) replays the book and streams the sierra
+    # .depth records (timestamps already converted and floored to ms) itself,
+    # incremental only diffs the levels touched since the previous state
+    print("start bento to depth")
+    if not os.path.exists(input_filepath):
         raise ValueError(f"data file {input_filepath} not found.")
-    os.system(f"bento-to-depth {input_filepath} temp.csv {snapshot_size} {n_states}")
-    bento_depth = pd.read_csv("temp.csv")
-    bento_depth["timestamp"] = bento_depth.timestamp.apply(
-        lambda ts: convert_to_sierra_timestamp(str(pd.to_datetime(ts, unit="ns")))
+    target_path = f"{output_filepath}.new" if append else output_filepath
+    mode = "incremental" if incremental else "snapshot"
+    status = os.system(
+        f"bento-to-depth {input_filepath} {target_path} {snapshot_size} {n_states} {mode}"
     )
-    bento_depth["timestamp"] = bento_depth.timestamp.apply(
-        lambda ts: (ts // 1000) * 1000
+    if status != 0:
+        raise Exception(f"bento-to-depth failed with status {status}")
+    if append:
+        write_depth_file(DepthFile(target_path).records, output_filepath, append=True)
+        os.remove(target_path)
+
+
+def bento_to_depth_incremental(
+    bento_zst_path, target_path, snapshot_size=100, n_states=None, append=False
+):
+    # pure python counterpart of `bento-to-depth ... incremental`
+    if os.path.exists(bento_zst_path):
+        data = db.DBNStore.from_file(bento_zst_path)
+    else:
+        raise ValueError(f"data file {bento_zst_path} not found.")
+
+    for first in data:
+        break
+    print(f"first -> {first}")
+    instrument_id, publisher_id = first.instrument_id, first.publisher_id
+    print(f"instrument_id -> {instrument_id}")
+    print(f"publisher_id -> {publisher_id}")
+
+    market = Market()
+    depth = IncrementalDepth(
+        market.get_book(instrument_id, publisher_id), snapshot_size
     )
-    bento_depth["timestamp"] = bento_depth.timestamp.astype(int)
-    bento_depth["orders"] = bento_depth["orders"].astype(int)
-    bento_depth["quantity"] = bento_depth["quantity"].astype(int)
-    bento_depth = bento_depth.sort_values(["timestamp", "price"])
-    depth_to_depth_file_for_sierra(bento_depth, output_filepath)
+    prev_timestamp = 0
+    counter = 0
+    batch = []
+    with DepthWriter(target_path, append=append) as writer:
+        for mbo in ProgIter(data):
+            market.apply(mbo)
+            if not mbo.flags & db.RecordFlags.F_LAST:
+                continue
+            diff = mbo.ts_event - prev_timestamp
+            prev_timestamp = mbo.ts_event
+            # check if within range of Sierra timestamps (if less than 1000 we need to aggregate the state)
+            if diff < 1000:
+                continue
+            timestamp = unix_ns_to_sierra(mbo.ts_event, resolution_us=1000)
+            batch += depth.emit_records(timestamp)
+            if len(batch) >= 100_000:
+                writer.write(np.array(batch, dtype=depth_rec_dtype))
+                batch.clear()
+            if n_states is None:
+                continue
+            counter += 1
+            if counter >= n_states:
+                print("n_states reached, break")
+                break
+        writer.write(np.array(batch, dtype=depth_rec_dtype))
+        print(f"records written -> {writer.n_records}")
+
+
+def instrument_symbols(data) -> dict[int, str]:
+    # raw symbol by instrument id from the DBN metadata mappings, if present
+    symbols = {}
+    for symbol, intervals in data.metadata.mappings.items():
+        for interval in intervals:
+            try:
+                symbols[int(interval["symbol"])] = symbol
+            except (KeyError, ValueError):
+                continue
+    return symbols
+
+
+def bento_to_depth_multi(
+    bento_zst_path,
+    target_dir,
+    snapshot_size=100,
+    by_publisher=False,
+    n_states=None,
+    append=False,
+):
+    # Replays the file once and writes one .depth file per instrument into
+    # `target_dir`, named after its symbol when the metadata has one. With
+    # by_publisher there is a file per (instrument, publisher), otherwise the
+    # publisher books of an instrument are summed per price level.
+    if os.path.exists(bento_zst_path):
+        data = db.DBNStore.from_file(bento_zst_path)
+    else:
+        raise ValueError(f"data file {bento_zst_path} not found.")
+    os.makedirs(target_dir, exist_ok=True)
+    symbols = instrument_symbols(data)
+
+    def target_path(instrument_id, publisher_id=None):
+        name = re.sub(r"[^\w.-]", "_", symbols.get(instrument_id, str(instrument_id)))
+        if publisher_id is not None:
+            name = f"{name}-{publisher_id}"
+        return os.path.join(target_dir, f"{name}.depth")
+
+    market = Market(book_factory=lambda: Book(track_touched=True))
+    depths, writers, paths = {}, {}, {}
+    batches = defaultdict(list)
+    # keys of the books changed since the last emitted state
+    dirty = set()
+    prev_timestamp = 0
+    counter = 0
+    try:
+        for mbo in ProgIter(data):
+            market.apply(mbo)
+            if by_publisher:
+                key = (mbo.instrument_id, mbo.publisher_id)
+            else:
+                key = mbo.instrument_id
+            if key not in depths:
+                if by_publisher:
+                    book = market.get_book(*key)
+                    paths[key] = target_path(*key)
+                else:
+                    book = AggregatedBook(market.get_books_by_pub(key))
+                    paths[key] = target_path(key)
+                depths[key] = IncrementalDepth(book, snapshot_size)
+                writers[key] = DepthWriter(paths[key], append=append)
+            dirty.add(key)
+            if not mbo.flags & db.RecordFlags.F_LAST:
+                continue
+            diff = mbo.ts_event - prev_timestamp
+            prev_timestamp = mbo.ts_event
+            # check if within range of Sierra timestamps (if less than 1000 we need to aggregate the state)
+            if diff < 1000:
+                continue
+            timestamp = unix_ns_to_sierra(mbo.ts_event, resolution_us=1000)
+            for key in dirty:
+                batch = batches[key]
+                batch += depths[key].emit_records(timestamp)
+                if len(batch) >= 100_000:
+                    writers[key].write(np.array(batch, dtype=depth_rec_dtype))
+                    batch.clear()
+            dirty.clear()
+            if n_states is None:
+                continue
+            counter += 1
+            if counter >= n_states:
+                print("n_states reached, break")
+                break
+        for key, writer in writers.items():
+            writer.write(np.array(batches[key], dtype=depth_rec_dtype))
+            print(f"{paths[key]} -> {writer.n_records} records")
+    finally:
+        for writer in writers.values():
+            writer.close()
+    return paths
+
+
+def bento_to_checkpoints(
+    bento_zst_path, checkpoint_path, every_events=1_000_000, every_seconds=None
+):
+    # one full replay of the file, saving the Market along the way for replay_to
+    if os.path.exists(bento_zst_path):
+        data = db.DBNStore.from_file(bento_zst_path)
+    else:
+        raise ValueError(f"data file {bento_zst_path} not found.")
+    every_ns = None if every_seconds is None else int(every_seconds * 1e9)
+    market = Market()
+    with CheckpointWriter(checkpoint_path, every_events, every_ns) as writer:
+        for n_records, mbo in enumerate(ProgIter(data), 1):
+            market.apply(mbo)
+            writer.update(market, mbo, n_records)
+        print(f"checkpoints written -> {len(writer.index)}")
+    return market
+
+
+def iter_mbo_from(data: db.DBNStore, n_records: int) -> Iterator[db.MBOMsg]:
+    # records of an MBO file from the n_records-th on. MBO records are fixed
+    # size, so the skipped ones are seeked over instead of decoded; a .zst
+    # file still decompresses them, but without building record objects.
+    reader = data.reader
+    _, metadata_len = struct.unpack("<4sI", reader.read(8))
+    record_len = db.MBOMsg.size_hint + (8 if data.metadata.ts_out else 0)
+    reader.seek(8 + metadata_len + n_records * record_len)
+    decoder = DBNDecoder(
+        has_metadata=False,
+        ts_out=data.metadata.ts_out,
+        input_version=data.metadata.version,
+        upgrade_policy=VersionUpgradePolicy.UPGRADE_TO_V3,
+    )
+    while raw := reader.read(db.DBNStore.DBN_READ_SIZE):
+        yield from decoder.write_and_decode(raw)
+
+
+def replay_to(bento_zst_path, ts_event, checkpoint_path=None, book_factory=Book):
+    # Market after every record up to `ts_event` (unix ns or a datetime),
+    # starting from the nearest earlier checkpoint instead of the file start
+    if os.path.exists(bento_zst_path):
+        data = db.DBNStore.from_file(bento_zst_path)
+    else:
+        raise ValueError(f"data file {bento_zst_path} not found.")
+    ts_event = unix_nanos(ts_event)
+    market = Market(book_factory=book_factory)
+    n_records = 0
+    if checkpoint_path is not None:
+        checkpoints = CheckpointFile(checkpoint_path)
+        pos = checkpoints.nearest(ts_event)
+        if pos is not None:
+            market = checkpoints.load(pos, book_factory)
+            n_records = int(checkpoints.index["n_records"][pos])
+    if data.schema == db.Schema.MBO:
+        records = iter_mbo_from(data, n_records)
+    else:
+        # mixed schemas have records of different sizes, decode to skip them
+        records = islice(data, n_records, None)
+    for mbo in records:
+        if mbo.ts_event > ts_event:
+            break
+        market.apply(mbo)
+    return market
 
 
 def bento_to_depth_slow(bento_zst_path, target_path, n_states=None):
@@ -489,10 +2038,12 @@ def bento_to_depth_slow(bento_zst_path, target_path, n_states=None):
             book = market.get_book(instrument_id, publisher_id).get_snapshot(
                 snapshot_size
             )
-            rows = [] if not init else [(0, 0, 0.0, "R")]
+            # prices stay fixed point integers until the end, merging on
+            # floats is slower and can split or merge levels
+            rows = [] if not init else [(0, 0, 0, "R")]
             for b in book:
-                rows.append((b.bid_ct, b.bid_sz, b.bid_px / price_resolution, "B"))
-                rows.append((b.ask_ct, b.ask_sz, b.ask_px / price_resolution, "A"))
+                rows.append((b.bid_ct, b.bid_sz, b.bid_px, "B"))
+                rows.append((b.ask_ct, b.ask_sz, b.ask_px, "A"))
 
             book_state = pd.DataFrame(rows)
             book_state.columns = ["orders", "quantity", "price", "side"]
@@ -501,12 +2052,7 @@ def bento_to_depth_slow(bento_zst_path, target_path, n_states=None):
                 .reset_index()
                 .drop(columns=["index"])
             )
-            sierra_timestamp = (
-                convert_to_sierra_timestamp(
-                    str(pd.to_datetime(mbo.ts_event, unit="ns"))
-                )
-                // 1000
-            ) * 1000
+            sierra_timestamp = unix_ns_to_sierra(mbo.ts_event, resolution_us=1000)
             book_state["timestamp"] = sierra_timestamp
             book_state = book_state[
                 ["timestamp", "orders", "quantity", "price", "side"]
@@ -518,7 +2064,7 @@ def bento_to_depth_slow(bento_zst_path, target_path, n_states=None):
                 prev = init_state[init_state.side != "R"]
                 init_depth = [
                     (
-                        (r.timestamp, "R", 0, 0, 0.0, 0)
+                        (r.timestamp, "R", 0, 0, 0, 0)
                         if r.side == "R"
                         else (
                             r.timestamp,
@@ -614,6 +2160,7 @@ def bento_to_depth_slow(bento_zst_path, target_path, n_states=None):
         lambda c: bento_to_sierra_command_mapping[c]
     )
     bento_depth["timestamp"] = bento_depth.timestamp.astype(int)
+    bento_depth["price"] = bento_depth.price.astype(np.int64) / price_resolution
     bento_depth["orders"] = bento_depth.orders.astype(int)
     bento_depth["quantity"] = bento_depth.quantity.astype(int)
     bento_depth.to_csv("temp_slow.csv", index=False)
@@ -630,7 +2177,6 @@ def bento_to_depth_slow(bento_zst_path, target_path, n_states=None):
 
 def bento_to_primary(bento):
     print("bento -> primary")
-    bento["ts_event"] = bento.ts_event.astype(str)
     bento = bento.reset_index().drop(columns=["ts_recv"])
     cols_to_drop = [
         "ts_event",
@@ -642,9 +2188,8 @@ def bento_to_primary(bento):
         "ts_in_delta",
         "symbol",
     ]
-    bento["timestamp"] = bento.ts_event.apply(convert_to_sierra_timestamp)
-    bento["ts"] = bento.timestamp.apply(convert_sierra_timestamp_to_datetime)
-    bento["ts"] = pd.to_datetime(bento.ts)
+    bento["timestamp"] = datetime64_to_sierra(bento.ts_event)
+    bento["ts"] = sierra_to_datetime64(bento.timestamp)
     bento = bento.drop(columns=cols_to_drop)
     bento = bento.rename(columns={"size": "size_"})
     bento = bento[bento.action != "T"]
@@ -664,10 +2209,10 @@ def primary_to_ticks(primary):
     ticks["num_trades"] = 1
     ticks["total_vol"] = ticks.size_
     ticks["bid_vol"] = ticks[["side", "size_"]].apply(
-        lambda r: r.size if r.side == "B" else 0, axis=1
+        lambda r: r.size_ if r.side == "B" else 0, axis=1
     )
     ticks["ask_vol"] = ticks[["side", "size_"]].apply(
-        lambda r: r.size if r.side == "A" else 0, axis=1
+        lambda r: r.size_ if r.side == "A" else 0, axis=1
     )
     ticks = ticks.drop(columns=["side", "price", "size_"])
     ticks = ticks.reset_index().drop(columns=["index"])
@@ -690,9 +2235,8 @@ def ticks_to_scid(ticks, target_path):
         )
         tas_recs.append(tas_rec)
 
-    header = b"SCID8\x00\x00\x00(\x00\x00\x00\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00"
     print("write bytes to", target_path)
-    tas_recs_bytes = header + b"".join(
+    tas_recs_bytes = scid_header + b"".join(
         Struct(intraday_rec_fmt).pack(*rec) for rec in tas_recs
     )
     with open(target_path, "wb") as f:
@@ -700,34 +2244,112 @@ def ticks_to_scid(ticks, target_path):
     print("done.")
 
 
-def depth_to_depth_file_for_sierra(depth, target_path):
-    header = b"SCDD@\x00\x00\x00\x18\x00\x00\x00\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00"
-    rec_format = "qbbhfII"
-    recs = []
-    for i in ProgIter(range(len(depth))):
-        rec = (
-            int(depth.iloc[i].timestamp),
-            int(depth.iloc[i].command),
-            int(depth.iloc[i].flag),
-            int(depth.iloc[i].orders),
-            float(depth.iloc[i].price),
-            int(depth.iloc[i].quantity),
-            0,
-        )
-        recs.append(rec)
-
-    print("write bytes to", target_path)
-    depth_bytes = header + b"".join(Struct(rec_format).pack(*rec) for rec in recs)
-    with open(target_path, "wb") as f:
-        f.write(depth_bytes)
-    print("done.")
+def depth_to_depth_file_for_sierra(depth, target_path, append=False):
+    write_depth_file(depth, target_path, append=append)
 
 
-def bento_to_sierra(input_filepath, output_scid_file, output_depth_file):
-    print("running -> bento to .scid (TODO: implement appending logic to the same scid file))")
-    bento_to_scid(input_filepath, output_scid_file)
+def bento_to_sierra(input_filepath, output_scid_file, output_depth_file, append=False):
+    # with append=True only records newer than the existing files are added
+    print("running -> bento to .scid")
+    bento_to_scid(input_filepath, output_scid_file, append)
     print("running -> bento to .depth")
-    bento_to_depth(input_filepath, output_depth_file)
+    bento_to_depth(input_filepath, output_depth_file, append=append)
+
+
+def list_bento_files(inputs):
+    # a directory (its .dbn/.dbn.zst files), a path pattern such as
+    # "data/*.mbo.dbn.zst", "data/2024-*/GLBX*.dbn.zst" or "data/**/*.dbn.zst"
+    # or a list of paths. pathlib instead of the `glob` module, which is
+    # shadowed by helpers/glob.py when this file is run as a script.
+    if isinstance(inputs, (list, tuple)):
+        paths = list(inputs)
+    elif os.path.isdir(inputs):
+        paths = [
+            os.path.join(inputs, name)
+            for name in os.listdir(inputs)
+            if name.endswith((".dbn", ".dbn.zst"))
+        ]
+    else:
+        # globbed from the leading components without wildcards
+        parts = Path(inputs).parts
+        n_base = next(
+            (i for i, part in enumerate(parts) if any(c in part for c in "*?[")),
+            len(parts),
+        )
+        base = Path(*parts[:n_base]) if n_base else Path(".")
+        pattern = os.path.join(*parts[n_base:]) if n_base < len(parts) else ""
+        if not pattern:
+            paths = [str(base)] if base.is_file() else []
+        else:
+            paths = [str(path) for path in base.glob(pattern) if path.is_file()]
+    if not paths:
+        raise ValueError(f"no DBN files found for {inputs}")
+    return sorted(paths)
+
+
+def bento_to_sierra_part(input_filepath, part_path):
+    # one input -> <part_path>.scid/.depth, the .done marker is only written
+    # once both are complete so an interrupted part is converted again
+    bento_to_scid(input_filepath, f"{part_path}.scid")
+    bento_to_depth(input_filepath, f"{part_path}.depth")
+    open(f"{part_path}.done", "w").close()
+    return part_path
+
+
+def merge_sierra_parts(file_type, writer_type, part_paths, target_path):
+    # concatenates the parts ordered by their first timestamp, written to a
+    # temporary file first so a crash never leaves a half merged target
+    parts = [file_type(path) for path in part_paths]
+    parts = sorted((p for p in parts if len(p)), key=lambda p: p.timestamps[0])
+    tmp_path = f"{target_path}.tmp"
+    last_timestamp = None
+    with writer_type(tmp_path) as writer:
+        for part in parts:
+            if last_timestamp is not None and part.timestamps[0] < last_timestamp:
+                raise ValueError(f"{part.path} overlaps with the previous part")
+            for chunk in part.iter_chunks():
+                writer.write(chunk.records)
+            last_timestamp = part.timestamps[-1]
+    os.replace(tmp_path, target_path)
+
+
+def bento_to_sierra_batch(
+    inputs, output_scid_file, output_depth_file, work_dir=None, max_workers=None
+):
+    # Converts many (daily) DBN files over a process pool and merges the parts
+    # in time order. Parts are kept in `work_dir` (next to the scid file by
+    # default), rerunning after a crash only converts inputs without a part.
+    input_paths = list_bento_files(inputs)
+    work_dir = work_dir or f"{output_scid_file}.parts"
+    os.makedirs(work_dir, exist_ok=True)
+    parts = {p: os.path.join(work_dir, os.path.basename(p)) for p in input_paths}
+    if len(set(parts.values())) != len(parts):
+        raise ValueError("input file names must be unique")
+    todo = [p for p, part in parts.items() if not os.path.exists(f"{part}.done")]
+    print(f"inputs -> {len(parts)}, already converted -> {len(parts) - len(todo)}")
+
+    failed = []
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(bento_to_sierra_part, p, parts[p]): p for p in todo}
+        for future in ProgIter(
+            as_completed(futures), total=len(futures), desc="convert"
+        ):
+            try:
+                future.result()
+            except Exception as e:
+                print(f"failed -> {futures[future]}: {e}")
+                failed.append(futures[future])
+    if failed:
+        raise Exception(f"{len(failed)} inputs failed, rerun to retry -> {failed}")
+
+    print("running -> merge parts")
+    part_paths = list(parts.values())
+    merge_sierra_parts(
+        ScidFile, ScidWriter, [f"{p}.scid" for p in part_paths], output_scid_file
+    )
+    merge_sierra_parts(
+        DepthFile, DepthWriter, [f"{p}.depth" for p in part_paths], output_depth_file
+    )
 
 
 if __name__ == "__main__":